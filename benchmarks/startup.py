@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Measure how long it takes to start using skew.
+
+Each statement is run in a fresh interpreter, ``--runs`` times, and the
+best and median wall-clock times are reported along with the heavy
+modules (boto3, botocore, yaml, ...) the statement ended up importing.
+The last statement measures the warm-up of the region metadata cache::
+
+    python benchmarks/startup.py --runs 20
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+Config = """---
+  accounts:
+    "123456789012":
+      profile: default
+"""
+
+Statements = [
+    ('python -c pass', 'pass'),
+    ('import skew', 'import skew'),
+    ('scan()', "import skew; "
+               "skew.scan('arn:aws:ec2:us-west-2:123456789012:instance/*')"),
+    ('region cache', 'import skew.regions; skew.regions.warm_up()'),
+]
+
+HeavyModules = ('boto3', 'botocore', 'jmespath', 'yaml', 'multiprocessing')
+
+Report = ("import sys; print(' '.join(sorted(set("
+          "m.split('.')[0] for m in sys.modules"
+          " if m.split('.')[0] in %r))))" % (HeavyModules,))
+
+
+def run(statement, env):
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', statement], env=env)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of runs of each statement')
+    args = parser.parse_args()
+
+    fd, config_path = tempfile.mkstemp(suffix='.yml')
+    with os.fdopen(fd, 'w') as config_file:
+        config_file.write(Config)
+    env = dict(os.environ)
+    env['SKEW_CONFIG'] = config_path
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    try:
+        print('%-14s %9s %9s  %s' % ('statement', 'best', 'median',
+                                      'heavy imports'))
+        for name, statement in Statements:
+            times = sorted(run(statement, env) for _ in range(args.runs))
+            modules = subprocess.check_output(
+                [sys.executable, '-c', statement + '; ' + Report],
+                env=env).decode().strip()
+            print('%-14s %7.1fms %7.1fms  %s' % (
+                name, times[0] * 1000, times[len(times) // 2] * 1000,
+                modules or '-'))
+    finally:
+        os.remove(config_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,8 @@ requires = [
     'boto3>=1.2.3',
     'six>=1.9.0',
     'python-dateutil>=2.1,<3.0.0',
-    'PyYAML>=3.11']
+    'PyYAML>=3.11',
+    'futures>=3.0.0; python_version < "3"']
 
 
 here = os.path.dirname(os.path.realpath(__file__))
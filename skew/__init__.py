@@ -36,5 +36,30 @@ def scan(sku, **kwargs):
     We could use some sort of dynamic loading of scheme classes
     but since there is currently only one (ARN) let's not over-complicate
     things.
+
+    Pass ``max_workers=N`` to enumerate the (service, region, account,
+    resource type) shards of the SKU concurrently on a pool of ``N``
+    threads.  Resources are then yielded as each shard completes.
+    With ``executor='process'`` the (account, region) pairs are spread
+    over ``max_workers`` worker processes instead, which helps when
+    building the resources, rather than the network, is the bottleneck.
     """
     return ARN(sku, **kwargs)
+
+
+def scan_async(sku, max_concurrency=10, **kwargs):
+    """
+    Scan a SKU from asyncio code.
+
+    Returns an async iterator over the same resources as ``scan``::
+
+        async for resource in skew.scan_async('arn:aws:ec2:*:*:instance/*'):
+            ...
+
+    Every (account, region, resource type) shard is enumerated as its
+    own task and at most ``max_concurrency`` shards run at once.
+    Resources are yielded as soon as the shard they belong to is done.
+    This requires Python 3.6 or later.
+    """
+    from skew.aio import AsyncScan
+    return AsyncScan(ARN(sku, **kwargs), max_concurrency)
@@ -0,0 +1,73 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+asyncio support for skew.  This module requires Python 3.6 or later and
+is only imported by ``skew.scan_async``.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncScan(object):
+    """
+    An async iterator over the resources matching an ``ARN``.
+
+    Each (account, region, resource type) shard of the ARN is enumerated
+    as its own task, at most ``max_concurrency`` of them at a time.  The
+    enumeration itself is the same blocking code used by ``ARN.__iter__``
+    (``Resource.enumerate`` and ``AWSClient.call``); it runs on a thread
+    pool owned by this scan so the event loop is never blocked.  The
+    resources of a shard are yielded as soon as that shard completes.
+    The shard sizes are saved to the ``sizes`` cache, as they are by
+    ``ARN.__iter__``, when the iteration is over.
+    """
+
+    def __init__(self, arn, max_concurrency=10):
+        self._arn = arn
+        self.max_concurrency = max_concurrency
+
+    def __repr__(self):
+        return repr(self._arn)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _run_shard(self, loop, executor, semaphore, shard):
+        async with semaphore:
+            LOG.debug('enumerating shard %s', shard)
+            return await loop.run_in_executor(
+                executor, self._arn._enumerate_shard, shard)
+
+    async def _iterate(self):
+        loop = asyncio.get_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = []
+        self._arn._clear_listings()
+        try:
+            shards = await loop.run_in_executor(executor, self._arn.shards)
+            tasks = [
+                asyncio.ensure_future(
+                    self._run_shard(loop, executor, semaphore, shard))
+                for shard in shards]
+            for next_done in asyncio.as_completed(tasks):
+                for resource in await next_done:
+                    yield resource
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=False)
+            self._arn._clear_listings()
+            self._arn._save_sizes()
@@ -13,18 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import logging
+import pickle
 import re
+import threading
+from collections import OrderedDict
 
 from six.moves import zip_longest
 from six import iteritems
-import jmespath
 
+import skew.regions
 import skew.resources
-from skew.config import get_config
-from skew.awsclient import SkewSessionFactory
-
-import botocore
+from skew.config import get_config, set_config
 
 LOG = logging.getLogger(__name__)
 DebugFmtString = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -109,32 +110,64 @@ class Resource(ARNComponent):
 
     def choices(self, context=None):
         if context:
+            provider = context[1]
             service = context[2]
         else:
+            provider = self._arn.provider.pattern
             service = self._arn.service.pattern
-        all_resources = skew.resources.all_types(
-            self._arn.provider.pattern, service)
+        all_resources = skew.resources.all_types(provider, service)
         if not all_resources:
             all_resources = ['*']
         return all_resources
 
     def enumerate(self, context, **kwargs):
         LOG.debug('Resource.enumerate %s', context)
+        for resource_type in self.matches(context):
+            for resource in self.enumerate_type(
+                    context, resource_type, **kwargs):
+                yield resource
+
+    def enumerate_type(self, context, resource_type, **kwargs):
+        """
+        Enumerate the resources of a single ``resource_type`` within
+        the (scheme, provider, service, region, account) ``context``.
+        This is the unit of work used when scanning in parallel.
+        """
         _, provider, service_name, region, account = context
-        resource_type, resource_id = self._split_resource(self.pattern)
+        _, resource_id = self._split_resource(self.pattern)
         LOG.debug('resource_type=%s, resource_id=%s',
                   resource_type, resource_id)
-        resources = []
-
+        from skew.awsclient import SkewSessionFactory
         session_factory = SkewSessionFactory(region, account, **kwargs)
+        resource_path = '.'.join([provider, service_name, resource_type])
+        resource_cls = skew.resources.find_resource_class(resource_path)
+        resources = resource_cls.enumerate(
+            session_factory, self._arn, resource_id)
+        from skew.cache import get_cache
+        if resource_id in (None, '*') and get_cache('sizes') is not None:
+            # Only complete enumerations tell how big a shard is
+            resources = _record_size(
+                resources, _size_key(resource_path, region, account),
+                self._arn)
+        return resources
 
-        for resource_type in self.matches(context):
-            resource_path = '.'.join([provider, service_name, resource_type])
-            resource_cls = skew.resources.find_resource_class(resource_path)
-            resources.extend(resource_cls.enumerate(
-                session_factory, self._arn, resource_id))
 
-        return resources
+def _size_key(resource_path, region, account):
+    return ':'.join([account, region, resource_path])
+
+
+def _record_size(resources, key, arn):
+    """
+    Yield ``resources`` and, once they have all been yielded, tell
+    ``arn`` how many there were.  The sizes are written to the ``sizes``
+    cache when the scan is over and ``ARN.explain`` uses them to
+    estimate the cost of a scan.
+    """
+    count = 0
+    for resource in resources:
+        count += 1
+        yield resource
+    arn._add_size(key, count)
 
 
 class Account(ARNComponent):
@@ -144,14 +177,26 @@ class Account(ARNComponent):
         super(Account, self).__init__(pattern, arn)
 
     def choices(self, context=None):
+        """
+        The accounts of the partition in ``context``.  If ``context``
+        also has a region, accounts with a ``regions`` list in the
+        config are only included if the region is in that list (or if
+        it is the empty region of the global services).
+        """
         LOG.debug('Account choices %s', context)
         if context and (len(context)>1):
             wanted_partition = context[1]
+            wanted_region = context[3] if len(context) > 3 else ''
             account_choices = []
             for account, account_obj in iteritems(self._accounts):
                 account_partition = account_obj.get('partition', 'aws')
-                if account_partition == wanted_partition:
-                    account_choices.append(account)
+                if account_partition != wanted_partition:
+                    continue
+                regions = account_obj.get('regions')
+                if wanted_region and regions and \
+                        wanted_region not in regions:
+                    continue
+                account_choices.append(account)
             return account_choices
         else:
             return list(self._accounts.keys())
@@ -177,11 +222,19 @@ class Region(ARNComponent):
             service_name = self._arn.service
         if service_name == 'elasticmapreduce':
             service_name = 'emr'
-        regions = botocore.session.Session().get_available_regions("%s" % (service_name), partition_name="%s" % (partition_name))
+        regions = skew.regions.get_regions(
+            "%s" % (service_name), partition_name="%s" % (partition_name))
         if (len(regions) == 0):
             regions = ['']
         return regions
 
+    def matches(self, context=None):
+        # Don't bother with the regions that none of the accounts use
+        if not context:
+            return super(Region, self).matches(context)
+        return [region for region in super(Region, self).matches(context)
+                if self._arn.account.matches(list(context) + [region])]
+
     def enumerate(self, context, **kwargs):
         LOG.debug('Region.enumerate %s', context)
         for match in self.matches(context):
@@ -214,7 +267,15 @@ class Service(ARNComponent):
 class Provider(ARNComponent):
 
     def choices(self, context=None):
-        return botocore.session.Session().get_available_partitions()
+        return skew.regions.get_partitions()
+
+    def matches(self, context=None):
+        # Partitions without any matching account are pruned before
+        # their services and regions are even looked at.
+        context = list(context or ['arn'])
+        return [partition
+                for partition in super(Provider, self).matches(context)
+                if self._arn.account.matches(context + [partition])]
 
     def enumerate(self, context, **kwargs):
         LOG.debug('Provider.enumerate %s', context)
@@ -241,6 +302,32 @@ class Scheme(ARNComponent):
             context.pop()
 
 
+def _enumerate_in_process(arn_string, kwargs, config, identity, alias,
+                          shards):
+    """
+    Enumerate ``shards`` inside a worker process.
+
+    Everything the worker needs is passed in explicitly so this works
+    the same with the ``fork`` and ``spawn`` start methods: the parent's
+    config and the known account identities/aliases are installed
+    before any client is created.  The resources are returned pickled,
+    along with the identities/aliases and the shard sizes, so that the
+    parent can update its own caches before it unpickles (and so
+    recreates clients for) them.
+    """
+    from skew.awsclient import AWSClient, unpickled_kwargs
+    set_config(config)
+    AWSClient._cached_identity.update(identity)
+    AWSClient._cached_alias.update(alias)
+    arn = ARN(arn_string, **unpickled_kwargs(kwargs))
+    resources = []
+    for shard in shards:
+        resources.extend(arn._enumerate_shard(shard))
+    return (AWSClient._cached_identity, AWSClient._cached_alias,
+            arn._take_sizes(),
+            pickle.dumps(resources, pickle.HIGHEST_PROTOCOL))
+
+
 class ARN(object):
 
     ComponentClasses = [Scheme, Provider, Service, Region, Account, Resource]
@@ -248,8 +335,15 @@ class ARN(object):
     def __init__(self, arn_string='arn:aws:*:*:*:*', **kwargs):
         self.query = None
         self._components = None
+        self._arn_string = arn_string
         self._build_components_from_string(arn_string)
+        self.max_workers = kwargs.pop('max_workers', None)
+        self.executor = kwargs.pop('executor', None)
         self.kwargs = kwargs
+        self._listings = {}
+        self._listings_lock = threading.Lock()
+        self._sizes = {}
+        self._sizes_lock = threading.Lock()
 
     def __repr__(self):
         return ':'.join([str(c) for c in self._components])
@@ -280,6 +374,7 @@ class ARN(object):
     def _build_components_from_string(self, arn_string):
         if '|' in arn_string:
             arn_string, query = arn_string.split('|')
+            import jmespath
             self.query = jmespath.compile(query)
         pairs = zip_longest(
             self.ComponentClasses, arn_string.split(':', 5), fillvalue='*')
@@ -309,7 +404,230 @@ class ARN(object):
     def resource(self):
         return self._components[5]
 
+    def shards(self):
+        """
+        Expand this ARN into the list of leaf work units without making
+        any API calls.  Each shard is a tuple of (scheme, provider,
+        service, region, account, resource_type) and can be enumerated
+        independently of all of the others.
+        """
+        return list(self._expand([], self._components))
+
+    def _expand(self, context, components):
+        component = components[0]
+        for match in component.matches(context):
+            if len(components) == 1:
+                yield tuple(context) + (match,)
+            else:
+                context.append(match)
+                for shard in self._expand(context, components[1:]):
+                    yield shard
+                context.pop()
+
+    def shared_listing(self, key, fetch):
+        """
+        Return the result of ``fetch()``, calling it only once per ``key``
+        during this scan.  This is used for the listings of global
+        services, which are the same for all of the regions of an
+        account.  Concurrent callers with the same ``key`` wait for the
+        first one rather than making the call themselves.  The listings
+        are forgotten when a scan starts and when it is over (see
+        ``_clear_listings``).
+        """
+        with self._listings_lock:
+            listing = self._listings.get(key)
+            if listing is None:
+                listing = self._listings[key] = [threading.Lock(), None]
+        with listing[0]:
+            if listing[1] is None:
+                listing[1] = fetch()
+        return listing[1]
+
+    def _clear_listings(self):
+        """
+        Forget the shared listings so that each iteration over this ARN
+        lists the resources again and none are kept once it is over.
+        """
+        with self._listings_lock:
+            self._listings = {}
+
+    def explain(self):
+        """
+        Describe what iterating over this ARN would do, without making
+        any API call.  The ARN is expanded into shards exactly as it is
+        when iterating and, for each resource type, the operations
+        implied by its ``enum_spec``, ``detail_spec`` and ``tags_spec``
+        are listed with an estimate of the number of calls.
+
+        Estimates are based on the number of resources found in each
+        shard by previous scans, which are kept in the ``sizes`` cache
+        when on-disk caching is enabled.  Shards that have never been
+        scanned are counted in ``unknown_shards`` and only their
+        per-shard calls are estimated.  Enumeration operations are
+        counted once per shard (or once per account for the global
+        listings) even though they can take several pages.
+        Tag calls are only made when the tags of a resource are read, so
+        they are counted separately, as are the calls only made on demand
+        (e.g. the detail calls made when the data of a resource is first
+        read).  The operations depend on the scan options: with
+        ``detail='full'`` the detail calls are made while enumerating
+        and counted as such, with ``detail='summary'`` they are not made
+        at all.
+        """
+        from skew.cache import get_cache
+        sizes = get_cache('sizes')
+        plan = OrderedDict([
+            ('shards', 0), ('unknown_shards', 0),
+            ('estimated_resources', 0), ('estimated_calls', 0),
+            ('estimated_tag_calls', 0), ('estimated_lazy_calls', 0),
+            ('resource_types', OrderedDict())])
+        accounts = set()
+        for shard in self.shards():
+            _, provider, service, region, account, resource_type = shard
+            resource_path = '.'.join([provider, service, resource_type])
+            summary = plan['resource_types'].get(resource_path)
+            if summary is None:
+                resource_cls = skew.resources.find_resource_class(
+                    resource_path)
+                summary = OrderedDict([
+                    ('shards', 0), ('unknown_shards', 0),
+                    ('estimated_resources', 0),
+                    ('operations', [
+                        OrderedDict([('kind', kind), ('operation', op),
+                                     ('per', per), ('estimated_calls', 0)])
+                        for kind, op, per in resource_cls.operations(
+                            **self.kwargs)])])
+                plan['resource_types'][resource_path] = summary
+            size = None
+            if sizes is not None:
+                size = sizes.get(_size_key(resource_path, region, account))
+            summary['shards'] += 1
+            plan['shards'] += 1
+            if size is None:
+                summary['unknown_shards'] += 1
+                plan['unknown_shards'] += 1
+                size = 0
+            summary['estimated_resources'] += size
+            plan['estimated_resources'] += size
+            for operation in summary['operations']:
+                if operation['per'] == 'shard':
+                    calls = 1
+                elif operation['per'] == 'account':
+                    calls = int((resource_path, account) not in accounts)
+                else:
+                    calls = size
+                operation['estimated_calls'] += calls
+                if operation['kind'] == 'tags':
+                    plan['estimated_tag_calls'] += calls
+                elif operation['kind'] == 'lazy':
+                    plan['estimated_lazy_calls'] += calls
+                else:
+                    plan['estimated_calls'] += calls
+            accounts.add((resource_path, account))
+        return plan
+
+    def _enumerate_shard(self, shard):
+        context, resource_type = list(shard[:-1]), shard[-1]
+        return list(self.resource.enumerate_type(
+            context, resource_type, **self.kwargs))
+
+    def _account_region_shards(self):
+        """
+        Group the shards by (account, region) so that each worker process
+        handles all of the resource types of one account and region.  The
+        shards of the resource types with a ``global_listing`` are grouped
+        by account instead, so that their listing is still made once per
+        account rather than once per worker process.
+        """
+        groups = OrderedDict()
+        for shard in self.shards():
+            _, provider, service, region, account, resource_type = shard
+            resource_cls = skew.resources.find_resource_class(
+                '.'.join([provider, service, resource_type]))
+            if getattr(resource_cls.Meta, 'global_listing', False):
+                key = (account, None)
+            else:
+                key = (account, region)
+            groups.setdefault(key, []).append(shard)
+        return list(groups.values())
+
+    def _unpickle_process_result(self, result):
+        from skew.awsclient import AWSClient
+        identity, alias, sizes, resources = result
+        AWSClient._cached_identity.update(identity)
+        AWSClient._cached_alias.update(alias)
+        with self._sizes_lock:
+            self._sizes.update(sizes)
+        return pickle.loads(resources)
+
+    def _add_size(self, key, count):
+        with self._sizes_lock:
+            self._sizes[key] = count
+
+    def _take_sizes(self):
+        with self._sizes_lock:
+            sizes, self._sizes = self._sizes, {}
+        return sizes
+
+    def _save_sizes(self):
+        """
+        Write the sizes of the shards enumerated so far to the ``sizes``
+        cache, in a single update.
+        """
+        sizes = self._take_sizes()
+        if not sizes:
+            return
+        from skew.cache import get_cache
+        cache = get_cache('sizes')
+        if cache is not None:
+            cache.update(sizes)
+
+    def _parallel_iter(self):
+        """
+        Enumerate all shards on a pool of ``max_workers`` threads or,
+        if ``executor`` is ``'process'``, of worker processes.
+        Resources are yielded shard by shard, in the order in which
+        the shards complete rather than in ARN order.
+        """
+        if self.executor == 'process':
+            from skew.awsclient import AWSClient, picklable_kwargs
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers)
+            kwargs = picklable_kwargs(self.kwargs)
+            futures = [
+                executor.submit(
+                    _enumerate_in_process, self._arn_string, kwargs,
+                    get_config(), AWSClient._cached_identity,
+                    AWSClient._cached_alias, shards)
+                for shards in self._account_region_shards()]
+            unpack = self._unpickle_process_result
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers)
+            futures = [executor.submit(self._enumerate_shard, shard)
+                       for shard in self.shards()]
+            unpack = list
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                for resource in unpack(future.result()):
+                    yield resource
+        finally:
+            # If the caller stops iterating early, don't bother
+            # running the shards that have not started yet.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
     def __iter__(self):
-        context = []
-        for scheme in self.scheme.enumerate(context, **self.kwargs):
-            yield scheme
+        self._clear_listings()
+        try:
+            if self.max_workers or self.executor:
+                for resource in self._parallel_iter():
+                    yield resource
+                return
+            context = []
+            for scheme in self.scheme.enumerate(context, **self.kwargs):
+                yield scheme
+        finally:
+            self._clear_listings()
+            self._save_sizes()
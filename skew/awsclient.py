@@ -12,16 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import importlib
 import logging
+import os
+import threading
 import time
+import types
+from collections import OrderedDict
 
 import datetime
 import jmespath
-import boto3
-import botocore.session
 import warnings
 from botocore.exceptions import ClientError
-
+from botocore.utils import merge_dicts, set_value_from_jmespath
+from six import string_types
+
+import skew.ratelimit
+import skew.regions
+import skew.retry
+import skew.sessions
+from skew.cache import get_cache
 from skew.config import get_config
 
 LOG = logging.getLogger(__name__)
@@ -40,6 +50,7 @@ class AWSClient(object):
     _cached_credentials = {}
     _cached_identity = {}
     _cached_alias = {}
+    _identity_lock = threading.RLock()
 
     @property
     def cached_credentials(self):
@@ -65,9 +76,32 @@ class AWSClient(object):
     def cached_alias(self, val):
         self._cached_alias = val
 
+    @property
+    def identity(self):
+        """
+        The result of ``sts.get_caller_identity`` for this account.  It is
+        only looked up the first time it is needed and is then cached for
+        the process and, if enabled, in the on-disk ``identity`` cache.
+        """
+        if self.account_id not in self.cached_identity:
+            with self._identity_lock:
+                if self.account_id not in self.cached_identity:
+                    self.cached_identity[self.account_id] = \
+                        self._get_identity()
+        return self.cached_identity[self.account_id]
+
     @property
     def account_name(self):
-        return self._cached_alias.get(self._account_id)
+        """
+        The account ID, followed by the IAM account alias if the account
+        has one.  This is looked up and cached the same way as
+        ``identity``, using the on-disk ``alias`` cache.
+        """
+        if self.account_id not in self.cached_alias:
+            with self._identity_lock:
+                if self.account_id not in self.cached_alias:
+                    self.cached_alias[self.account_id] = self._get_alias()
+        return self.cached_alias[self.account_id]
 
     def __init__(self, service_name, region_name, account_id, **kwargs):
         self._config = get_config()
@@ -86,6 +120,10 @@ class AWSClient(object):
         self.placebo_dir = kwargs.get('placebo_dir')
         self.placebo_mode = kwargs.get('placebo_mode', 'record')
         self._partition_name = self._config['accounts'][self._account_id].get('partition', 'aws')
+        self._retry_policy = skew.retry.get_retry_policy()
+        self._retry_budget = skew.retry.RetryBudget(self._retry_policy.budget)
+        self._rate_limiter = skew.ratelimit.get_rate_limiter(
+            self._account_id, self._region_name, self._service_name)
         self._client = self._create_client()
 
     @property
@@ -116,99 +154,80 @@ class AWSClient(object):
             region = None
         LOG.debug("region: %r" % (region))
 
-        # Unsupported way to retrieve 'global' main region for a given partition
         if region is None:
-            finished = False
-            LOG.debug("partition: %r" % (self.partition_name))
-            null_session = botocore.session.get_session()
-            available_regions = null_session.get_available_regions('iam', partition_name=self.partition_name, allow_non_regional=True)
-
-            LOG.debug("available_regions: %r" % (available_regions))
-            if len(available_regions) > 0:
-                global_region = available_regions[0]
-            else:
-                LOG.warn("Strange, get_available_regions('iam', partition_name=%r, allow_non_regional=True) returned empty response %r", self.partition_name, available_regions)
-                finished = True
-
-            if not finished:
-                resolver = null_session.get_component('endpoint_resolver')
-                LOG.debug("resolver: %r" % (resolver))
-                finished = (resolver is None)
-
-            if not finished:
-                endpoint = resolver.construct_endpoint('iam', region_name=global_region)
-                LOG.debug("endpoint: %r" % (endpoint))
-                finished = ((endpoint is None) or (len(endpoint) == 0))
-
-            if not finished:
-                region = endpoint.get('credentialScope', {}).get('region')
-                LOG.debug("region: %r" % (region))
+            region = skew.regions.get_global_region(self.partition_name)
+            LOG.debug("region: %r" % (region))
 
+        # Sessions are shared by all of the clients of a profile (or set
+        # of credentials) so the region is given per client instead.
         if self.aws_creds:
             LOG.debug("Session with creds %r", self.aws_creds)
-            session = boto3.Session(**self.aws_creds)
         elif self.profile is not None:
             LOG.debug("Session with profile : %s", self.profile)
-            if region:
-                LOG.debug("Region")
-                session = boto3.Session(profile_name=self.profile, region_name=region)
-            else:
-                LOG.debug("Not Region")
-                session = boto3.Session(profile_name=self.profile)
-        else:
-            LOG.debug("Session")
-            if region:
-                LOG.debug("Region")
-                session = boto3.Session(region_name=region)
-            else:
-                LOG.debug("Not Region")
-                session = boto3.Session()
+        session = skew.sessions.get_session(
+            profile_name=self.profile, aws_creds=self.aws_creds,
+            placebo=self.placebo, placebo_dir=self.placebo_dir,
+            placebo_mode=self.placebo_mode)
         LOG.debug("session: %r" % (session))
 
-        if self.placebo and self.placebo_dir:
-            pill = self.placebo.attach(session, self.placebo_dir)
-            if self.placebo_mode == 'record':
-                pill.record()
-            elif self.placebo_mode == 'playback':
-                pill.playback()
-
-        if (self.account_id not in self.cached_identity):
-            sts_client = session.client('sts')
-            LOG.debug("sts_client:%s" % (sts_client))
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                identity = sts_client.get_caller_identity()
-            LOG.debug("identity:%s" % (identity))
-            self.cached_identity[self.account_id] = {}
-            self.cached_identity[self.account_id]['UserId'] = identity.get('UserId')
-            self.cached_identity[self.account_id]['Account'] = identity.get('Account')
-            self.cached_identity[self.account_id]['Arn'] = identity.get('Arn')
-            LOG.debug("Region:%s Account:%s Identity:%s" % (self._region_name, self.account_id, self.cached_identity[self.account_id]))
-        else:
-            LOG.debug("Region:%s Account:%s Identity from cache:%s" % (self._region_name, self.account_id, self.cached_identity[self.account_id]))
-        # self._identity_userid = self.cached_identity.get('UserId')
-        # self._identity_account = self.cached_identity.get('Account')
-        # self._identity_arn = self.cached_identity.get('Arn')
-
-        if (self.account_id not in self.cached_alias):
-            iam_client = session.client('iam')
-            LOG.debug("iam_client:%s" % (iam_client))
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                accountaliases = iam_client.list_account_aliases()
-            LOG.debug("Aliases:%s" % (accountaliases))
-            if len(accountaliases.get('AccountAliases', [])) > 0:
-                accountalias = "%s (%s)" % (self.cached_identity.get(self.account_id, {}).get('Account'), accountaliases.get('AccountAliases')[0])
-            else:
-                accountalias = "%s" % (self.cached_identity.get(self.account_id, {}).get('Account'))
-            self.cached_alias[self.account_id] = accountalias
-            LOG.debug("Region:%s Account:%s Stored account alias:%s" % (self._region_name, self.account_id, self.cached_alias[self.account_id]))
+        # The session and the global region are kept so that the caller
+        # identity and the account alias can be looked up if needed.
+        self._session = session
+        self._global_region = region
+
+        return skew.sessions.create_client(
+            session, self.service_name,
+            region_name=self.region_name or region)
+
+    def _get_identity(self):
+        disk_cache = get_cache('identity')
+        if disk_cache is not None:
+            identity = disk_cache.get(self.account_id)
+            if identity is not None:
+                LOG.debug("Account:%s Identity from disk cache:%s" % (self.account_id, identity))
+                return identity
+        sts_client = skew.sessions.create_client(
+            self._session, 'sts', region_name=self._global_region)
+        LOG.debug("sts_client:%s" % (sts_client))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            response = skew.ratelimit.get_rate_limiter(
+                self.account_id, None, 'sts').call(
+                    sts_client.get_caller_identity)
+        LOG.debug("identity:%s" % (response))
+        identity = {}
+        identity['UserId'] = response.get('UserId')
+        identity['Account'] = response.get('Account')
+        identity['Arn'] = response.get('Arn')
+        LOG.debug("Region:%s Account:%s Identity:%s" % (self._region_name, self.account_id, identity))
+        if disk_cache is not None:
+            disk_cache.set(self.account_id, identity)
+        return identity
+
+    def _get_alias(self):
+        disk_cache = get_cache('alias')
+        if disk_cache is not None:
+            accountalias = disk_cache.get(self.account_id)
+            if accountalias is not None:
+                LOG.debug("Account:%s Account alias from disk cache:%s" % (self.account_id, accountalias))
+                return accountalias
+        iam_client = skew.sessions.create_client(
+            self._session, 'iam', region_name=self._global_region)
+        LOG.debug("iam_client:%s" % (iam_client))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            accountaliases = skew.ratelimit.get_rate_limiter(
+                self.account_id, None, 'iam').call(
+                    iam_client.list_account_aliases)
+        LOG.debug("Aliases:%s" % (accountaliases))
+        if len(accountaliases.get('AccountAliases', [])) > 0:
+            accountalias = "%s (%s)" % (self.identity.get('Account'), accountaliases.get('AccountAliases')[0])
         else:
-            LOG.debug("Region:%s Account:%s Cached account alias:%s" % (self._region_name, self.account_id, self.cached_alias[self.account_id]))
-
-        return session.client(
-            self.service_name,
-            region_name=self.region_name)
+            accountalias = "%s" % (self.identity.get('Account'))
+        LOG.debug("Region:%s Account:%s Stored account alias:%s" % (self._region_name, self.account_id, accountalias))
+        if disk_cache is not None:
+            disk_cache.set(self.account_id, accountalias)
+        return accountalias
 
     def call(self, op_name, query=None, **kwargs):
         """
@@ -224,6 +243,9 @@ class AWSClient(object):
             will be applied to the data returned from the low-level
             call.  This allows you to tailor the returned data to be
             exactly what you want.
+          * Throttled requests are retried according to the retry
+            policy (see ``skew.retry``).  Errors that can't be retried
+            are logged and an empty result is returned.
 
         :type op_name: str
         :param op_name: The name of the request you wish to make.
@@ -240,60 +262,164 @@ class AWSClient(object):
         LOG.debug(kwargs)
         if query:
             query = jmespath.compile(query)
-        if self._client.can_paginate(op_name):
-            done = False
-            data = {}
-            while not done:
-                try:
-                    paginator = self._client.get_paginator(op_name)
-                    results = paginator.paginate(**kwargs)
-                    data = results.build_full_result()
-                    done = True
-                except ClientError as e:
-                    LOG.exception(str(e))
-                    LOG.debug(kwargs)
-                    if 'Throttling' in str(e):
-                        time.sleep(1)
-                    elif 'AccessDenied' in str(e):
-                        done = True
-                    elif 'NoSuchTagSet' in str(e):
-                        done = True
-                    elif 'UnsupportedOperation' in str(e):
-                        done = True
-                    elif 'ResourceNotFoundFault' in str(e):
-                        done = True
-                except Exception as e:
-                    LOG.exception(str(e))
-                    LOG.debug(kwargs)
-                    done = True
-        else:
-            op = getattr(self._client, op_name)
-            done = False
-            data = {}
-            while not done:
-                try:
-                    data = op(**kwargs)
-                    done = True
-                except ClientError as e:
-                    # LOG.exception(e)
-                    # LOG.debug(kwargs)
-                    if 'Throttling' in str(e):
-                        time.sleep(1)
-                    elif 'AccessDenied' in str(e):
-                        done = True
-                    elif 'NoSuchTagSet' in str(e):
-                        done = True
-                    elif 'UnsupportedOperation' in str(e):
-                        done = True
-                    elif 'ResourceNotFoundFault' in str(e):
-                        done = True
-                except Exception as e:
-                    LOG.exception(str(e))
-                    done = True
+        data = {}
+        try:
+            if self._client.can_paginate(op_name):
+                page_iterators = []
+                pages = list(self._iter_pages(
+                    op_name, page_iterators=page_iterators, **kwargs))
+                if page_iterators:
+                    data = _merge_pages(page_iterators, pages)
+            else:
+                for page in self._iter_pages(op_name, **kwargs):
+                    data = page
+        except Exception as e:
+            LOG.exception(str(e))
+            LOG.debug(kwargs)
         if query:
             data = query.search(data)
         return data
 
+    def _iter_pages(self, op_name, page_iterators=None, **kwargs):
+        """
+        Yield the raw response pages of an operation as they arrive.
+        Operations that can't be paginated produce a single page.
+
+        Each request goes through the rate limiter of this client's
+        account, region and service.  Failed requests, including the
+        ones that fail to connect or time out, are handled according to
+        the retry policy.
+        When a page has to be retried, the pagination is resumed from
+        that page so the pages already yielded are not repeated.  The
+        botocore page iterators used are appended to ``page_iterators``.
+        """
+        paginated = self._client.can_paginate(op_name)
+        starting_token = None
+        attempts = 0
+        while True:
+            try:
+                if paginated:
+                    paginator = self._client.get_paginator(op_name)
+                    pages = paginator.paginate(
+                        PaginationConfig={'StartingToken': starting_token},
+                        **kwargs)
+                    if page_iterators is not None:
+                        page_iterators.append(pages)
+                    page_iterator = iter(pages)
+                    while True:
+                        page = self._rate_limiter.call(
+                            next, page_iterator, None)
+                        if page is None:
+                            break
+                        attempts = 0
+                        self._retry_budget.deposit()
+                        starting_token = _resume_token(pages, page)
+                        yield page
+                else:
+                    page = self._rate_limiter.call(
+                        getattr(self._client, op_name), **kwargs)
+                    self._retry_budget.deposit()
+                    yield page
+                return
+            except (ClientError,) + skew.retry.ConnectionErrors as e:
+                LOG.debug(kwargs)
+                action = self._retry_policy.classify(e)
+                if action == skew.retry.IGNORE:
+                    LOG.debug('ignoring error: %s', e)
+                    return
+                attempts += 1
+                if (action == skew.retry.RETRY and
+                        self._retry_policy.should_retry(
+                            op_name, attempts, self._retry_budget)):
+                    delay = self._retry_policy.delay(op_name, attempts)
+                    LOG.debug('retrying %s in %.2fs: %s', op_name, delay, e)
+                    time.sleep(delay)
+                else:
+                    raise
+
+    def iter_pages(self, op_name, query=None, **kwargs):
+        """
+        Make a request to a method in this client and yield the
+        response data one page at a time rather than building the
+        full result in memory first, as ``call`` does.
+
+        If a jmespath ``query`` is given it is applied to each page.
+        When the query returns a list its items are yielded one at a
+        time, otherwise the query result itself is yielded.  Without a
+        query each page is yielded whole.
+
+        :type op_name: str
+        :param op_name: The name of the request you wish to make.
+
+        :type query: str
+        :param query: A jmespath query that will be applied to each
+            page of data returned by the operation.
+
+        :type kwargs: keyword arguments
+        :param kwargs: Additional keyword arguments you want to pass
+            to the method when making the request.
+        """
+        LOG.debug(kwargs)
+        if query:
+            query = jmespath.compile(query)
+        for page in self._iter_pages(op_name, **kwargs):
+            if query is None:
+                yield page
+                continue
+            data = query.search(page)
+            if isinstance(data, list):
+                for item in data:
+                    yield item
+            elif data is not None:
+                yield data
+
+
+def _resume_token(page_iterator, page):
+    """
+    The token resuming the pagination of ``page_iterator`` after ``page``.
+    botocore only sets ``resume_token`` when ``MaxItems`` is reached, so
+    it is computed from the page here.
+    """
+    next_token = page_iterator._get_next_token(page)
+    if not any(next_token.values()):
+        return None
+    page_iterator.resume_token = next_token
+    return page_iterator.resume_token
+
+
+def _merge_pages(page_iterators, pages):
+    """
+    Merge the pages of a paginated operation into a single response,
+    the same way botocore's ``PageIterator.build_full_result`` does.
+    ``page_iterators`` are the page iterators that produced the pages
+    (more than one if the pagination had to be resumed).
+    """
+    result_keys = page_iterators[0].result_keys
+    complete_result = {}
+    for page in pages:
+        for result_expression in result_keys:
+            result_value = result_expression.search(page)
+            if result_value is None:
+                continue
+            existing_value = result_expression.search(complete_result)
+            if existing_value is None:
+                set_value_from_jmespath(
+                    complete_result, result_expression.expression,
+                    result_value)
+            elif isinstance(result_value, list):
+                existing_value.extend(result_value)
+            elif isinstance(result_value, (int, float) + string_types):
+                set_value_from_jmespath(
+                    complete_result, result_expression.expression,
+                    existing_value + result_value)
+    # The non-aggregate part is recorded from the first page returned
+    # by each page iterator, so use the first iterator that got a page.
+    for page_iterator in page_iterators:
+        if page_iterator.non_aggregate_part:
+            merge_dicts(complete_result, page_iterator.non_aggregate_part)
+            break
+    return complete_result
+
 
 def get_awsclient(service_name, region_name, account_id, **kwargs):
     if region_name == '':
@@ -301,6 +427,110 @@ def get_awsclient(service_name, region_name, account_id, **kwargs):
     return AWSClient(service_name, region_name, account_id, **kwargs)
 
 
+class _ModuleName(str):
+    pass
+
+
+def picklable_kwargs(kwargs):
+    """
+    Return a copy of ``kwargs`` that can be pickled.  Modules (e.g. the
+    ``placebo`` module) can't be pickled so they are replaced by their
+    name and imported again by ``unpickled_kwargs``.
+    """
+    result = {}
+    for key, value in kwargs.items():
+        if isinstance(value, types.ModuleType):
+            value = _ModuleName(value.__name__)
+        result[key] = value
+    return result
+
+
+def unpickled_kwargs(kwargs):
+    result = {}
+    for key, value in kwargs.items():
+        if isinstance(value, _ModuleName):
+            value = importlib.import_module(value)
+        result[key] = value
+    return result
+
+
+class ClientPool(object):
+    """
+    A thread-safe pool of ``AWSClient`` objects so that a client is built
+    once per (account, credentials, partition, region, service) rather
+    than once per use.  The pool holds at most ``maxsize`` clients and
+    evicts the least recently used one when it is full.
+
+    Clients are not shared with child processes: if the pool is used
+    after a fork it starts over empty, with a new lock.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        # The inherited lock may be held by a thread that doesn't exist
+        # in this process, replace it rather than acquiring it.
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def _key(self, service_name, region_name, account_id, kwargs):
+        aws_creds = kwargs.get('aws_creds')
+        if aws_creds:
+            credentials = tuple(sorted(aws_creds.items()))
+        else:
+            credentials = None
+        partition = get_config()['accounts'][account_id].get(
+            'partition', 'aws')
+        return (account_id, credentials, partition, region_name or None,
+                service_name, kwargs.get('placebo_dir'),
+                kwargs.get('placebo_mode'))
+
+    def get_client(self, service_name, region_name, account_id, **kwargs):
+        key = self._key(service_name, region_name, account_id, kwargs)
+        self._check_fork()
+        with self._lock:
+            client = self._clients.pop(key, None)
+            if client is not None:
+                self._clients[key] = client
+                return client
+        # Build the client outside of the lock, it can take a while.  If
+        # another thread built the same client meanwhile, keep theirs.
+        client = AWSClient(service_name, region_name, account_id, **kwargs)
+        with self._lock:
+            client = self._clients.pop(key, client)
+            self._clients[key] = client
+            while len(self._clients) > self.maxsize:
+                self._clients.popitem(last=False)
+        return client
+
+    def clear(self):
+        self._check_fork()
+        with self._lock:
+            self._clients.clear()
+
+
+client_pool = ClientPool()
+
+
+def _reset_after_fork():
+    AWSClient._identity_lock = threading.RLock()
+    client_pool._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
 class SkewSessionFactory(object):
 
     def __init__(self, region, account, **kwargs):
@@ -308,5 +538,15 @@ class SkewSessionFactory(object):
         self.account = account
         self.kwargs = kwargs
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['kwargs'] = picklable_kwargs(self.kwargs)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.kwargs = unpickled_kwargs(self.kwargs)
+
     def get_client(self, service_name):
-        return AWSClient(service_name, self.region_name, self.account, **self.kwargs)
+        return client_pool.get_client(
+            service_name, self.region_name, self.account, **self.kwargs)
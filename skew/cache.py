@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Optional on-disk caches, shared by all of the skew processes of a user.
+
+Caching is enabled by adding a ``cache`` section to the skew config::
+
+    cache:
+      path: ~/.cache/skew
+      ttl: 86400
+      identity:
+        ttl: 604800
+
+``path`` is the directory holding the cache files and ``ttl`` the default
+number of seconds an entry stays valid.  The ``ttl`` of an individual
+cache can be overridden in a section named after the cache.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from skew.config import get_config
+
+LOG = logging.getLogger(__name__)
+
+DefaultTTL = 86400
+
+_lock = threading.Lock()
+_caches = {}
+
+
+class FileCache(object):
+    """
+    A dictionary of JSON-serializable values stored in a single file.
+    Entries expire ``ttl`` seconds after they were written.
+
+    The file is re-read before each write and replaced atomically, so
+    several processes can share it; if two of them write at the same
+    time one of the updates may be lost, which is fine for a cache.
+    """
+
+    def __init__(self, path, ttl=DefaultTTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _read(self):
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, OSError, ValueError) as e:
+            LOG.debug('unable to read cache %s: %s', self.path, e)
+            return {}
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(data, tmp_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            LOG.warning('unable to write cache %s: %s', self.path, e)
+
+    def _is_fresh(self, entry):
+        return entry[0] + self.ttl > time.time()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if self._data is None:
+                self._data = self._read()
+            entry = self._data.get(key)
+        if entry is None or not self._is_fresh(entry):
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        now = time.time()
+        with self._lock:
+            data = self._read()
+            for key, value in values.items():
+                data[key] = [now, value]
+            # Don't let expired entries pile up
+            data = dict((k, v) for k, v in data.items() if self._is_fresh(v))
+            self._write(data)
+            self._data = data
+
+
+def get_cache(name):
+    """
+    Return the on-disk cache called ``name`` or None if on-disk caching
+    is not enabled in the skew config.
+    """
+    config = get_config().get('cache')
+    if not config or not config.get('path'):
+        return None
+    with _lock:
+        if name not in _caches:
+            path = os.path.expandvars(os.path.expanduser(config['path']))
+            ttl = config.get(name, {}).get('ttl', config.get('ttl', DefaultTTL))
+            _caches[name] = FileCache(
+                os.path.join(path, '%s.json' % name), ttl)
+        return _caches[name]
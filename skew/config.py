@@ -15,8 +15,6 @@
 import os
 import logging
 
-import yaml
-
 from skew.exception import ConfigNotFoundError
 
 LOG = logging.getLogger(__name__)
@@ -33,6 +31,16 @@ def get_config():
         path = os.path.expandvars(path)
         if not os.path.exists(path):
             raise ConfigNotFoundError('Unable to find skew config file')
+        import yaml
         with open(path) as config_file:
             _config = yaml.load(config_file)
     return _config
+
+
+def set_config(config):
+    """
+    Install an already loaded config.  This is used to hand the parent's
+    config to worker processes, which may not see the same environment.
+    """
+    global _config
+    _config = config
@@ -0,0 +1,86 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Concurrent follow-up calls for the resources of a shard.
+
+Some resource classes make one or more calls for every resource they
+enumerate (e.g. the resources of a CloudFormation stack, or the details
+of a DynamoDB table with ``detail='full'``).  ``enrich`` runs these calls
+on a bounded pool of threads while the enumeration goes on and yields
+the resources in the order they were enumerated.  The calls go through
+the rate limiter of their client like any other call.
+
+A call that fails doesn't abort the shard: the error is logged and added
+to the ``enrichment_errors`` of the resource, which is yielded anyway.
+
+The size of the pool is set with the ``enrich_workers`` scan option.
+"""
+
+import collections
+import concurrent.futures
+import logging
+
+LOG = logging.getLogger(__name__)
+
+DefaultWorkers = 8
+# How many calls can be queued per worker before waiting for the oldest
+PendingPerWorker = 4
+
+
+def _failed(resource, func, error):
+    LOG.warning('%s failed for %r: %s',
+                getattr(func, '__name__', func), resource, error)
+    errors = getattr(resource, 'enrichment_errors', None) or []
+    errors.append(error)
+    resource.enrichment_errors = errors
+
+
+def _finish(resource, func, future):
+    try:
+        future.result()
+    except Exception as e:
+        _failed(resource, func, e)
+    return resource
+
+
+def enrich(resources, func, max_workers=None):
+    """
+    Call ``func`` with each of ``resources`` on a pool of ``max_workers``
+    threads and generate the resources, in order, once their call is
+    done.  With ``max_workers`` set to 1 the calls are made in the
+    calling thread.
+    """
+    if max_workers is None:
+        max_workers = DefaultWorkers
+    if max_workers <= 1:
+        for resource in resources:
+            try:
+                func(resource)
+            except Exception as e:
+                _failed(resource, func, e)
+            yield resource
+        return
+    pending = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    try:
+        for resource in resources:
+            pending.append((resource, executor.submit(func, resource)))
+            while len(pending) >= max_workers * PendingPerWorker:
+                resource, future = pending.popleft()
+                yield _finish(resource, func, future)
+        while pending:
+            resource, future = pending.popleft()
+            yield _finish(resource, func, future)
+    finally:
+        # The consumer may stop early, don't make the remaining calls
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
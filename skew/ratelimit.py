@@ -0,0 +1,201 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Client-side rate limiting of the requests made by ``AWSClient``.
+
+All of the requests made to a service, in a region, for an account go
+through the same ``RateLimiter``, whichever thread makes them.  A limiter
+combines a token bucket (``rate`` requests per second with bursts of up to
+``burst`` requests) with a limit on the number of requests in flight.
+That limit is adjusted AIMD-style: it is halved every time a request is
+throttled and grows back slowly, up to ``max_concurrency``, as requests
+succeed.  botocore doesn't retry the requests itself (see
+``skew.sessions.create_client``), so the limiter sees every throttled
+request as soon as it happens and the retries wait outside of it.
+
+The built-in defaults can be changed in the ``rate_limits`` section of
+the skew config, for all services and per service::
+
+    rate_limits:
+      rate: 20
+      burst: 20
+      max_concurrency: 10
+      services:
+        iam:
+          rate: 2
+          max_concurrency: 2
+
+Limiters are not shared between processes, so with ``executor='process'``
+the limits apply to each worker process.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+import skew.retry
+from skew.config import get_config
+
+LOG = logging.getLogger(__name__)
+
+DefaultSettings = {
+    'rate': 20,
+    'burst': 20,
+    'max_concurrency': 10,
+}
+
+# Services with (much) lower API limits than the default settings.
+ServiceDefaults = {
+    'cloudformation': {'rate': 4, 'burst': 8, 'max_concurrency': 4},
+    'cloudfront': {'rate': 4, 'burst': 8, 'max_concurrency': 4},
+    'iam': {'rate': 5, 'burst': 10, 'max_concurrency': 4},
+    'route53': {'rate': 4, 'burst': 5, 'max_concurrency': 2},
+    'sts': {'rate': 10, 'burst': 10, 'max_concurrency': 4},
+}
+
+_lock = threading.Lock()
+_limiters = {}
+_pid = os.getpid()
+
+
+def _reset_after_fork():
+    global _lock, _limiters, _pid
+    # The inherited locks may be held by threads that don't exist in
+    # this process, replace them (and the limiters) rather than wait.
+    _lock = threading.Lock()
+    _limiters = {}
+    _pid = os.getpid()
+
+
+def _check_fork():
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket combined with an AIMD concurrency limit.
+    """
+
+    def __init__(self, rate=DefaultSettings['rate'],
+                 burst=DefaultSettings['burst'],
+                 max_concurrency=DefaultSettings['max_concurrency']):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self._tokens = self.burst
+        self._last = time.time()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """
+        Block until a request can be made.  Every call must be followed
+        by a call to ``release``.
+        """
+        with self._cond:
+            while self._in_flight >= int(self.concurrency):
+                self._cond.wait()
+            self._in_flight += 1
+        while True:
+            with self._cond:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def release(self, throttled=False):
+        """
+        Signal the end of a request and whether it was throttled.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.concurrency = max(1.0, self.concurrency / 2)
+                # Don't let the rest of the burst hit the API right away
+                self._tokens = min(self._tokens, 0)
+                LOG.debug('throttled, concurrency is now %d',
+                          self.concurrency)
+            else:
+                self.concurrency = min(
+                    self.max_concurrency,
+                    self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call ``func`` once the limiter allows it.
+        """
+        self.acquire()
+        throttled = False
+        try:
+            return func(*args, **kwargs)
+        except ClientError as e:
+            throttled = skew.retry.is_throttling_error(e)
+            raise
+        finally:
+            self.release(throttled)
+
+
+def get_settings(service_name):
+    """
+    The settings of the rate limiters of ``service_name``: the built-in
+    defaults (for all services, then for ``service_name``), overridden
+    by the ``rate_limits`` section of the config (for all services, then
+    for ``service_name``).
+    """
+    config = get_config().get('rate_limits') or {}
+    settings = dict(DefaultSettings)
+    settings.update(ServiceDefaults.get(service_name, {}))
+    settings.update(
+        (k, v) for k, v in config.items() if k in DefaultSettings)
+    settings.update(config.get('services', {}).get(service_name, {}))
+    return settings
+
+
+def get_rate_limiter(account_id, region_name, service_name):
+    """
+    Return the limiter shared by all of the requests to ``service_name``
+    in ``region_name`` for ``account_id``.
+    """
+    key = (account_id, region_name or None, service_name)
+    _check_fork()
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(**get_settings(service_name))
+            _limiters[key] = limiter
+        return limiter
+
+
+def clear():
+    """
+    Forget all of the rate limiters.
+    """
+    _check_fork()
+    with _lock:
+        _limiters.clear()
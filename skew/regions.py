@@ -0,0 +1,160 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Process-wide cache of the partition and region metadata of botocore.
+
+The available partitions, the regions of a service in a partition and
+the "global" region of a partition (the region where global services
+such as IAM are called) never change for a given botocore version, so
+they are looked up once and then served from memory.  ``warm_up`` fills
+the cache ahead of time and returns how long that took.
+
+A forked child process keeps the metadata but gets its own lock and
+botocore session.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import skew.sessions
+
+LOG = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_session = None
+_partitions = None
+_regions = {}
+_global_regions = {}
+_pid = os.getpid()
+
+
+def _reset_after_fork():
+    global _lock, _session, _pid
+    _lock = threading.RLock()
+    _session = None
+    _pid = os.getpid()
+
+
+def _check_fork():
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_session():
+    global _session
+    _check_fork()
+    if _session is None:
+        _session = skew.sessions.get_botocore_session()
+    return _session
+
+
+def get_partitions():
+    """
+    Return the names of all of the partitions known to botocore.
+    """
+    global _partitions
+    _check_fork()
+    if _partitions is None:
+        with _lock:
+            if _partitions is None:
+                _partitions = _get_session().get_available_partitions()
+    return list(_partitions)
+
+
+def get_regions(service_name, partition_name='aws'):
+    """
+    Return the regions in which ``service_name`` is available in
+    ``partition_name``.  The list is empty for global services.
+    """
+    key = (partition_name, service_name)
+    _check_fork()
+    regions = _regions.get(key)
+    if regions is None:
+        with _lock:
+            regions = _regions.get(key)
+            if regions is None:
+                regions = _get_session().get_available_regions(
+                    service_name, partition_name=partition_name)
+                _regions[key] = regions
+    return list(regions)
+
+
+def get_global_region(partition_name='aws'):
+    """
+    Return the region used to sign the requests made to the global
+    services of ``partition_name`` (e.g. ``us-east-1`` for ``aws``) or
+    None if it can't be found.
+    """
+    _check_fork()
+    if partition_name not in _global_regions:
+        with _lock:
+            if partition_name not in _global_regions:
+                _global_regions[partition_name] = \
+                    _find_global_region(partition_name)
+    return _global_regions[partition_name]
+
+
+def _find_global_region(partition_name):
+    # Unsupported way to retrieve 'global' main region for a given partition
+    available_regions = _get_session().get_available_regions(
+        'iam', partition_name=partition_name, allow_non_regional=True)
+    LOG.debug("available_regions: %r" % (available_regions))
+    if not available_regions:
+        LOG.debug("Strange, get_available_regions('iam', partition_name=%r, allow_non_regional=True) returned empty response %r", partition_name, available_regions)
+        return None
+    resolver = skew.sessions.get_endpoint_resolver()
+    endpoint = resolver.construct_endpoint(
+        'iam', region_name=available_regions[0])
+    LOG.debug("endpoint: %r" % (endpoint))
+    if not endpoint:
+        return None
+    return endpoint.get('credentialScope', {}).get('region')
+
+
+def warm_up(services=None, partitions=None):
+    """
+    Look up the regions of ``services`` (by default, all of the services
+    skew knows about) in ``partitions`` (by default, all of them) and the
+    global region of each partition.  Returns the number of seconds it
+    took.
+    """
+    start = time.time()
+    if partitions is None:
+        partitions = get_partitions()
+    if services is None:
+        import skew.resources
+        services = skew.resources.all_services('aws')
+    for partition in partitions:
+        get_global_region(partition)
+        for service in services:
+            get_regions(service, partition)
+    elapsed = time.time() - start
+    LOG.debug('region metadata warmed up in %.3fs', elapsed)
+    return elapsed
+
+
+def clear():
+    """
+    Forget all of the cached metadata.
+    """
+    global _session, _partitions
+    _check_fork()
+    with _lock:
+        _session = None
+        _partitions = None
+        _regions.clear()
+        _global_regions.clear()
@@ -14,9 +14,12 @@
 
 import importlib
 import logging
-import botocore.session
+import threading
+
 from six import iteritems
 
+import skew.regions
+
 LOG = logging.getLogger(__name__)
 
 # Maps resources names as they appear in ARN's to the path name
@@ -210,66 +213,88 @@ ResourceTypesTemplate = {
     # AWS X-Ray   xray
 }
 
-# Create (by duplication of the main set) new set of
-# resource definition for all other partitions.
-# This occurs only if the service is not already explicitely defined.
-# Only services supported by those partitions are duplicated
+# Resource definitions for the other partitions are created (by
+# duplication of the main set) the first time a partition is looked up,
+# so that importing skew doesn't load the endpoint data.  A resource is
+# duplicated only if it is not already explicitely defined and if its
+# service is supported by the partition.  Use the functions below rather
+# than reading ResourceTypes directly.
 ResourceTypes = ResourceTypesTemplate.copy()
-null_session = botocore.session.Session()
-all_partitions = null_session.get_available_partitions()
 
-for key, value in iteritems(ResourceTypesTemplate):
-    t = key.split('.')
-    resource_partition = t[0]
-    resource_boto_service = t[1]
-    if (resource_partition == 'aws'):
-        for partition in all_partitions:
+# ResourceTypes indexed by partition, then service, then resource type.
+_index = {}
+# The classes already loaded by find_resource_class.
+_classes = {}
+
+_lock = threading.Lock()
+_expanded_partitions = set(['aws'])
+
+
+def _add_resource_types(resource_types):
+    """
+    Add ``resource_types`` to ResourceTypes and to the index.  The index
+    of a partition is replaced rather than updated in place, so it can
+    be read without holding the lock.
+    """
+    partitions = {}
+    for key, value in iteritems(resource_types):
+        partition, service, resource_type = key.split('.')
+        if partition not in partitions:
+            partitions[partition] = dict(
+                (s, dict(t)) for s, t in iteritems(_index.get(partition, {})))
+        partitions[partition].setdefault(service, {})[resource_type] = value
+    ResourceTypes.update(resource_types)
+    _index.update(partitions)
+
 
-            # Main partition, already defined
-            if partition == 'aws':
-                continue
+_add_resource_types(ResourceTypesTemplate)
 
-            # Remove services not existing for this partition
-            regions = null_session.get_available_regions("%s" % (resource_boto_service), partition_name="%s" % (partition))
-            if not regions or (len(regions) == 0):
-                continue
 
-            # Let's define resources for this new partition
-            t[0] = partition
-            new_key = '.'.join(t)
-            if new_key not in ResourceTypes:
-                ResourceTypes[new_key] = value
+def _expand_partition(partition):
+    if partition in _expanded_partitions:
+        return
+    with _lock:
+        if partition in _expanded_partitions:
+            return
+        if partition in skew.regions.get_partitions():
+            LOG.debug('adding resource types for partition %s', partition)
+            new_types = {}
+            for service, types in iteritems(_index['aws']):
+                # Remove services not existing for this partition
+                if not skew.regions.get_regions(service, partition):
+                    continue
+                for resource_type, value in iteritems(types):
+                    new_key = '.'.join([partition, service, resource_type])
+                    if new_key not in ResourceTypes:
+                        new_types[new_key] = value
+            _add_resource_types(new_types)
+        _expanded_partitions.add(partition)
 
 
 def all_providers():
-    providers = set()
-    for resource_type in ResourceTypes:
-        providers.add(resource_type.split('.')[0])
-    return list(providers)
+    for partition in skew.regions.get_partitions():
+        _expand_partition(partition)
+    return list(_index)
 
 
 def all_services(provider_name):
-    services = set()
-    for resource_type in ResourceTypes:
-        t = resource_type.split('.')
-        if t[0] == provider_name:
-            services.add(t[1])
-    return list(services)
+    _expand_partition(provider_name)
+    return list(_index.get(provider_name, {}))
 
 
 def all_types(provider_name, service_name):
-    types = set()
-    for resource_type in ResourceTypes:
-        t = resource_type.split('.')
-        if t[0] == provider_name and t[1] == service_name:
-            types.add(t[2])
-    return list(types)
+    _expand_partition(provider_name)
+    return list(_index.get(provider_name, {}).get(service_name, {}))
 
 
 def find_resource_class(resource_path):
     """
     dynamically load a class from a string
     """
+    resource_cls = _classes.get(resource_path)
+    if resource_cls is not None:
+        return resource_cls
+    _expand_partition(resource_path.split('.')[0])
     class_path = ResourceTypes[resource_path]
     # First prepend our __name__ to the resource string passed in.
     full_path = '.'.join([__name__, class_path])
@@ -278,4 +303,6 @@ def find_resource_class(resource_path):
     class_str = class_data[-1]
     module = importlib.import_module(module_path)
     # Finally, we retrieve the Class
-    return getattr(module, class_str)
+    resource_cls = getattr(module, class_str)
+    _classes[resource_path] = resource_cls
+    return resource_cls
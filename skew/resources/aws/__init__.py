@@ -14,15 +14,22 @@
 
 import logging
 import datetime
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict
 
 import jmespath
+from botocore.exceptions import ClientError
 
 import skew.awsclient
+import skew.enrichment
+import skew.retry
 from skew.resources.resource import Resource
 
 LOG = logging.getLogger(__name__)
 
+DetailModes = ('lazy', 'full', 'summary')
+DefaultDetailMode = 'lazy'
+
 
 class MetricData(object):
     """
@@ -68,6 +75,23 @@ class AWSResource(Resource):
         needed to the call of the operation, in addition to the parameter
         used to identify the specific resource (e.g. needed for Route53).
         Those constants are expressed in a dict of key, value pairs.
+    * inline_tags - [OPTIONAL] For the classes with a tags_spec whose
+      enumeration operation also returns the tags, a jmespath query to
+      find them in the data of the resource (e.g. 'TagList' for RDS
+      instances).  When they are there, the tags_spec call is skipped.
+    * batch_tags_spec - [OPTIONAL] Some tags operations accept several
+      resources at once (e.g. ELB DescribeTags takes up to 20 load
+      balancers).  The ``prefetch_tags`` classmethod uses this to fetch
+      the tags of many resources with a few calls.  It is a tuple
+      consisting of:
+      * operation name
+      * jmespath query to find the entries in the response
+      * the name of the parameter listing the resources
+      * the attribute of the resource to put in that list and to find
+        its entries (e.g. 'id' or 'arn')
+      * the key of the entries holding that value
+      * the key of the entries holding the list of tags
+      * the maximum number of resources per call
     * detail_spec - Some services provide only summary information in the
       list or describe method and require you to make another request to get
       the detailed info for a specific resource.  If that is the case, this
@@ -75,6 +99,17 @@ class AWSResource(Resource):
       details, the parameter name to pass in to identify the desired
       resource and the jmespath filter to apply to the results to get
       the details.
+    * lazy_detail - [OPTIONAL] True if the class calls ``_defer_detail``
+      to fetch the details of its resources.  How and when they are
+      fetched is then chosen with the ``detail`` scan option: the first
+      time ``data`` is read ('lazy', the default), concurrently while
+      enumerating ('full') or never ('summary', ``data`` only holds what the
+      enumeration operation returned).
+    * global_listing - [OPTIONAL] True if the enumeration operation returns
+      the same resources whatever the region of the client (e.g. S3
+      ListBuckets).  The listing is then made only once per account during
+      a scan and shared by all of the regions, the resource class being
+      responsible for keeping the resources of each region.
     * id - The name of the field within the resource data that uniquely
       identifies the resource.
     * dimension - The CloudWatch dimension for this resource.  A value
@@ -88,6 +123,97 @@ class AWSResource(Resource):
     class Meta(object):
         type = 'awsresource'
 
+    # The value to pass to the detail_spec operation, until it is called
+    _pending_detail = None
+
+    @classmethod
+    def enumerate(cls, session_factory, arn, resource_id=None, **kwargs):
+        resources = super(AWSResource, cls).enumerate(
+            session_factory, arn, resource_id, **kwargs)
+        scan_options = getattr(session_factory, 'kwargs', {})
+        if scan_options.get('detail') == 'full' and cls.flyweight and \
+                getattr(cls.Meta, 'lazy_detail', False):
+            resources = cls._enrich(
+                session_factory, resources, cls._fetch_detail)
+        if scan_options.get('prefetch_tags') and cls.flyweight and \
+                getattr(cls.Meta, 'batch_tags_spec', None):
+            resources = cls._prefetching_tags(resources)
+        return resources
+
+    @classmethod
+    def _enrich(cls, session_factory, resources, func):
+        """
+        Call ``func`` with each of ``resources`` concurrently, see
+        ``skew.enrichment``.
+        """
+        scan_options = getattr(session_factory, 'kwargs', {})
+        return skew.enrichment.enrich(
+            resources, func, scan_options.get('enrich_workers'))
+
+    @classmethod
+    def _prefetching_tags(cls, resources):
+        batch_size = cls.Meta.batch_tags_spec[6]
+        batch = []
+        for resource in resources:
+            batch.append(resource)
+            if len(batch) >= batch_size:
+                cls.prefetch_tags(batch)
+                for r in batch:
+                    yield r
+                batch = []
+        if batch:
+            cls.prefetch_tags(batch)
+            for r in batch:
+                yield r
+
+    @classmethod
+    def prefetch_tags(cls, resources):
+        """
+        Fetch the tags of ``resources``, which must all be of this class
+        and come from the same client, with as few calls as the
+        ``batch_tags_spec`` of the class allows.  Reading the ``tags`` of
+        these resources then doesn't make any call.  This does nothing
+        for the classes without a ``batch_tags_spec``.  If a batch fails,
+        the tags of its resources are fetched one by one, with the
+        ``tags_spec``, when they are read.
+        """
+        spec = getattr(cls.Meta, 'batch_tags_spec', None)
+        if not spec:
+            return
+        resources = [r for r in resources
+                     if not (r._tags_fetched or r._use_inline_tags())]
+        if not resources:
+            return
+        method, path, param_name, param_value, match_key, tags_key, \
+            batch_size = spec
+        by_value = OrderedDict(
+            (getattr(r, param_value), r) for r in resources)
+        found = dict((value, []) for value in by_value)
+        values = list(by_value)
+        client = resources[0]._client
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            LOG.debug('prefetching tags of %d resources', len(batch))
+            try:
+                for entry in client.iter_pages(
+                        method, query=path, **{param_name: batch}):
+                    value = entry.get(match_key)
+                    if value in found:
+                        found[value].extend(entry.get(tags_key) or [])
+            except (ClientError,) + skew.retry.ConnectionErrors as e:
+                # e.g. a resource deleted since it was enumerated, the
+                # tags of this batch are fetched one by one when read.
+                LOG.warning('unable to prefetch the tags of %s: %s',
+                            ', '.join(batch), e)
+                for value in batch:
+                    del found[value]
+        for value, resource in by_value.items():
+            if value not in found:
+                continue
+            resource.data['Tags'] = found[value]
+            resource._tags = None
+            resource._tags_fetched = True
+
     @classmethod
     def filter(cls, arn, resource_id, data):
         pass
@@ -113,10 +239,91 @@ class AWSResource(Resource):
         self._date = None
         self._tags = None
         self._tags_expected = None
+        self._tags_fetched = False
+        self._detail_lock = threading.Lock()
 
     def __repr__(self):
         return self.arn
 
+    @property
+    def data(self):
+        if self._pending_detail is not None:
+            self._load_detail()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def _defer_detail(self, value, summary):
+        """
+        Arrange for ``data`` to hold the details returned by the
+        detail_spec operation for ``value``, according to the ``detail``
+        scan option (see ``lazy_detail``).  ``summary`` is what ``data``
+        holds if the details are never fetched.
+        """
+        session_options = getattr(self._session, 'kwargs', {})
+        mode = session_options.get('detail') or DefaultDetailMode
+        if mode not in DetailModes:
+            raise ValueError('detail must be one of %s, not %r' % (
+                ', '.join(DetailModes), mode))
+        self._data = summary
+        if mode != 'summary':
+            self._pending_detail = value
+
+    def _load_detail(self):
+        """
+        Call the detail_spec operation if it hasn't been called yet.  If
+        it fails or returns nothing, ``data`` keeps the summary and the
+        error is logged.
+        """
+        try:
+            self._fetch_detail()
+        except Exception as e:
+            LOG.warning('unable to load the details of %s: %s', self.id, e)
+
+    def _fetch_detail(self):
+        """
+        Same as ``_load_detail`` but errors are raised, so that ``enrich``
+        adds them to the ``enrichment_errors`` of the resource when the
+        details are fetched while enumerating.
+        """
+        if self._pending_detail is None:
+            return
+        with self._detail_lock:
+            value = self._pending_detail
+            if value is None:
+                # Loaded by another thread meanwhile
+                return
+            detail_op, param_name, detail_path = self.Meta.detail_spec
+            LOG.debug('loading the details of %s', value)
+            try:
+                detail = None
+                for page in self._client.iter_pages(
+                        detail_op, **{param_name: value}):
+                    detail = jmespath.search(detail_path, page)
+                if detail:
+                    self._data = detail
+                else:
+                    LOG.warning('no details for %s, keeping its summary',
+                                value)
+            finally:
+                self._pending_detail = None
+
+    def __getstate__(self):
+        # Clients can't be pickled, they are recreated from the session
+        # factory when the resource is unpickled.
+        state = self.__dict__.copy()
+        state['_client'] = None
+        state['_cloudwatch'] = None
+        state['_detail_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._client = self._session.get_client(self.Meta.service)
+        self._detail_lock = threading.Lock()
+
     @property
     def account_name(self):
         return self._client.account_name
@@ -134,7 +341,7 @@ class AWSResource(Resource):
         if self._metrics is None:
             if getattr(self.Meta, 'dimension', None):
                 if self._cloudwatch is None:
-                    self._cloudwatch = self.session.get_client('cloudwatch')
+                    self._cloudwatch = self._session.get_client('cloudwatch')
                 data = self._cloudwatch.call(
                     'list_metrics',
                     Dimensions=[{'Name': self.Meta.dimension,
@@ -158,6 +365,22 @@ class AWSResource(Resource):
         return self._tags_expected
 
 
+    def _use_inline_tags(self):
+        """
+        If the data of the resource already holds its tags (see
+        ``inline_tags``), use them rather than calling the tags_spec.
+        """
+        path = getattr(self.Meta, 'inline_tags', None)
+        if not path or not isinstance(self.data, dict):
+            return False
+        tags = jmespath.search(path, self.data)
+        if tags is None:
+            return False
+        LOG.debug('using the tags found in %s', path)
+        self.data['Tags'] = tags
+        self._tags_fetched = True
+        return True
+
     @property
     def tags(self):
         """
@@ -170,20 +393,22 @@ class AWSResource(Resource):
 
             if hasattr(self.Meta, 'tags_spec') and (self.Meta.tags_spec is not None):
                 self._tags_expected = True
-                LOG.debug('have a tags_spec')
-                method, path, param_name, param_value = self.Meta.tags_spec[:4]
-                kwargs = {}
-                filter_type = getattr(self.Meta, 'filter_type', None)
-                if filter_type == 'list':
-                    kwargs = {param_name: [getattr(self, param_value)]}
-                else:
-                    kwargs = {param_name: getattr(self, param_value)}
-                if len(self.Meta.tags_spec) > 4:
-                    kwargs.update(self.Meta.tags_spec[4])
-                LOG.debug('fetching tags')
-                self.data['Tags'] = self._client.call(
-                    method, query=path, **kwargs)
-                LOG.debug(self.data['Tags'])
+                if not (self._tags_fetched or self._use_inline_tags()):
+                    LOG.debug('have a tags_spec')
+                    method, path, param_name, param_value = self.Meta.tags_spec[:4]
+                    kwargs = {}
+                    filter_type = getattr(self.Meta, 'filter_type', None)
+                    if filter_type == 'list':
+                        kwargs = {param_name: [getattr(self, param_value)]}
+                    else:
+                        kwargs = {param_name: getattr(self, param_value)}
+                    if len(self.Meta.tags_spec) > 4:
+                        kwargs.update(self.Meta.tags_spec[4])
+                    LOG.debug('fetching tags')
+                    self.data['Tags'] = self._client.call(
+                        method, query=path, **kwargs)
+                    self._tags_fetched = True
+                    LOG.debug(self.data['Tags'])
 
             if 'Tags' in self.data:
                 self._tags_expected = True
@@ -10,58 +10,66 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
-import jmespath
-
 from skew.resources.aws import AWSResource
 
 
 class Stack(AWSResource):
+    """
+    Iterating over a stack generates its resources, page by page, as
+    ``ListStackResources`` returns them.  They are only listed while
+    enumerating, concurrently, with the ``stack_resources`` scan option,
+    in which case they are kept in the ``Resources`` entry of the data
+    of the stack.
+    """
 
     @classmethod
     def enumerate(cls, session_factory, arn, resource_id=None):
         resources = super(Stack, cls).enumerate(
             session_factory, arn, resource_id)
-
-        for stack in resources:
-            stack.data['Resources'] = []
-            for stack_resource in stack:
-                resource_id = stack_resource.get('PhysicalResourceId')
-                if not resource_id:
-                    resource_id = stack_resource.get('LogicalResourceId')
-                stack.data['Resources'].append(
-                    {
-                        'id': resource_id,
-                        'type': stack_resource['ResourceType']
-                    }
-                )
+        scan_options = getattr(session_factory, 'kwargs', {})
+        if scan_options.get('stack_resources'):
+            resources = cls._enrich(
+                session_factory, resources, cls._add_resources)
         return resources
 
+    @classmethod
+    def operations(cls, **scan_options):
+        if scan_options.get('stack_resources'):
+            kind = 'detail'
+        else:
+            kind = 'lazy'
+        return super(Stack, cls).operations(**scan_options) + [
+            (kind, 'list_stack_resources', 'resource')]
+
+    def _add_resources(self):
+        self.data['Resources'] = []
+        for stack_resource in self:
+            resource_id = stack_resource.get('PhysicalResourceId')
+            if not resource_id:
+                resource_id = stack_resource.get('LogicalResourceId')
+            self.data['Resources'].append(
+                {
+                    'id': resource_id,
+                    'type': stack_resource['ResourceType']
+                }
+            )
+
     class Meta(object):
         service = 'cloudformation'
         type = 'stack'
         enum_spec = ('describe_stacks', 'Stacks[]', None)
-        detail_spec = ('describe_stack_resources', 'StackName',
-                       'StackResources[]')
+        detail_spec = None
         id = 'StackName'
         filter_name = 'StackName'
         name = 'StackName'
         date = 'CreationTime'
         dimension = None
 
-    def __init__(self, session_factory, client, data, query=None):
-        super(Stack, self).__init__(session_factory, client, data, query)
-        self._data = data
-        self._resources = None
-
     def __iter__(self):
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: self.id}
-        if self._resources is None:
-            data = self._client.call(detail_op, **params)
-            self._resources = jmespath.search(detail_path, data)
-        for resource in self._resources:
-            yield resource
+        return self._client.iter_pages(
+            'list_stack_resources', query='StackResourceSummaries',
+            StackName=self.id)
 
     @property
     def arn(self):
-        return self._data['StackId']
+        return self.data['StackId']
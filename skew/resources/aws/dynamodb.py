@@ -14,8 +14,6 @@
 
 import logging
 
-import jmespath
-
 from skew.resources.aws import AWSResource
 
 
@@ -36,6 +34,7 @@ class Table(AWSResource):
         name = 'TableName'
         date = 'CreationDateTime'
         dimension = 'TableName'
+        lazy_detail = True
 
     @classmethod
     def filter(cls, arn, resource_id, data):
@@ -45,7 +44,4 @@ class Table(AWSResource):
     def __init__(self, session_factory, client, data, query=None):
         super(Table, self).__init__(session_factory, client, data, query)
         self._id = data
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: self.id}
-        data = client.call(detail_op, **params)
-        self.data = jmespath.search(detail_path, data)
+        self._defer_detail(self.id, {'TableName': self.id})
@@ -34,6 +34,9 @@ class LoadBalancer(AWSResource):
         dimension = 'LoadBalancerName'
         tags_spec = ('describe_tags', 'TagDescriptions[].Tags[]',
                      'LoadBalancerNames', 'id')
+        batch_tags_spec = ('describe_tags', 'TagDescriptions[]',
+                           'LoadBalancerNames', 'id', 'LoadBalancerName',
+                           'Tags', 20)
 
 class LoadBalancerV2(AWSResource):
 
@@ -51,6 +54,8 @@ class LoadBalancerV2(AWSResource):
         dimension = 'LoadBalancerArn'
         tags_spec = ('describe_tags', 'TagDescriptions[].Tags[]',
                      'ResourceArns', 'id')
+        batch_tags_spec = ('describe_tags', 'TagDescriptions[]',
+                           'ResourceArns', 'id', 'ResourceArn', 'Tags', 20)
 
     # @classmethod
     # def enumerate(cls, session_factory, arn, resource_id=None):
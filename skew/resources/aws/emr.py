@@ -34,16 +34,26 @@ class Cluster(AWSResource):
         tags_spec = ('describe_cluster', 'Cluster.Tags[]',
                      'ClusterId', 'id')
 
+    @classmethod
+    def operations(cls, **scan_options):
+        # Active and terminated clusters are listed separately
+        return [('enum', 'list_clusters', 'shard'),
+                ('enum', 'list_clusters', 'shard')] + \
+            super(Cluster, cls).operations(**scan_options)
+
     @classmethod
     def enumerate(cls, session_factory, arn, resource_id=None):
-        # Let's fetch all TERMINATED cluster - created at max 3 days ago
-        cls.Meta.enum_spec = ('list_clusters', 'Clusters[]', {'ClusterStates': ['TERMINATED', 'TERMINATED_WITH_ERRORS'], 'CreatedAfter': (datetime.datetime.now() + datetime.timedelta(-3))})
-        resources_inactive = super(Cluster, cls).enumerate(
-            session_factory, arn, resource_id)
+        # The enum_spec is passed per call rather than stored on Meta
+        # so that concurrent enumerations don't step on each other.
 
         # Let's fetch all RUNNING cluster - no time limit
-        cls.Meta.enum_spec = ('list_clusters', 'Clusters[]', {'ClusterStates': ['STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING', 'TERMINATING']})
-        resources_active = super(Cluster, cls).enumerate(
-            session_factory, arn, resource_id)
+        enum_spec = ('list_clusters', 'Clusters[]', {'ClusterStates': ['STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING', 'TERMINATING']})
+        for r in super(Cluster, cls).enumerate(
+                session_factory, arn, resource_id, enum_spec=enum_spec):
+            yield r
 
-        return resources_active + resources_inactive
+        # Let's fetch all TERMINATED cluster - created at max 3 days ago
+        enum_spec = ('list_clusters', 'Clusters[]', {'ClusterStates': ['TERMINATED', 'TERMINATED_WITH_ERRORS'], 'CreatedAfter': (datetime.datetime.now() + datetime.timedelta(-3))})
+        for r in super(Cluster, cls).enumerate(
+                session_factory, arn, resource_id, enum_spec=enum_spec):
+            yield r
@@ -12,8 +12,6 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
-import jmespath
-
 from skew.resources.aws import AWSResource
 
 
@@ -31,11 +29,9 @@ class ElasticsearchDomain(AWSResource):
         name = 'DomainName'
         date = None
         dimension = 'DomainName'
+        lazy_detail = True
 
     def __init__(self, session_factory, client, data, query=None):
         super(ElasticsearchDomain, self).__init__(session_factory, client, data, query)
         self._id = data
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: self.id}
-        data = client.call(detail_op, **params)
-        self.data = jmespath.search(detail_path, data)
+        self._defer_detail(self.id, {'DomainName': self.id})
@@ -11,8 +11,6 @@
 
 from skew.resources.aws import AWSResource
 
-import jmespath
-
 class DeliveryStream(AWSResource):
 
     class Meta(object):
@@ -26,11 +24,9 @@ class DeliveryStream(AWSResource):
         name = 'DeliveryStreamName'
         date = 'CreateTimestamp'
         dimension = 'DeliveryStreamName'
+        lazy_detail = True
 
     def __init__(self, session_factory, client, data, query=None):
         super(DeliveryStream, self).__init__(session_factory, client, data, query)
         self._id = data
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: self.id}
-        data = client.call(detail_op, **params)
-        self.data = jmespath.search(detail_path, data)
+        self._defer_detail(self.id, {'DeliveryStreamName': self.id})
@@ -26,13 +26,39 @@ class Function(AWSResource):
     def enumerate(cls, session_factory, arn, resource_id=None):
         resources = super(Function, cls).enumerate(
             session_factory, arn, resource_id)
+        event_sources = None
         for r in resources:
-            r.data['EventSources'] = []
-            kwargs = {'FunctionName': r.data['FunctionName']}
-            response = r._client.call('list_event_source_mappings', **kwargs)
-            for esm in response['EventSourceMappings']:
-                r.data['EventSources'].append(esm['EventSourceArn'])
-        return resources
+            if event_sources is None:
+                event_sources = cls._list_event_sources(
+                    r._client, resource_id)
+            r.data['EventSources'] = list(
+                event_sources.get(r.data.get('FunctionArn'), []))
+            yield r
+
+    @classmethod
+    def _list_event_sources(cls, client, resource_id=None):
+        """
+        List the event source mappings of the region (or of the function
+        ``resource_id``) with one paginated call and return the ARNs of
+        their event sources by function ARN.  Mappings attached to an
+        alias or a version are returned with their function.
+        """
+        kwargs = {}
+        if resource_id and resource_id != '*':
+            kwargs['FunctionName'] = resource_id
+        event_sources = {}
+        for esm in client.iter_pages('list_event_source_mappings',
+                                     query='EventSourceMappings', **kwargs):
+            # Drop the alias or version of qualified ARNs
+            function_arn = ':'.join(esm['FunctionArn'].split(':')[:7])
+            event_sources.setdefault(function_arn, []).append(
+                esm['EventSourceArn'])
+        return event_sources
+
+    @classmethod
+    def operations(cls, **scan_options):
+        return super(Function, cls).operations(**scan_options) + [
+            ('detail', 'list_event_source_mappings', 'shard')]
 
     class Meta(object):
         service = 'lambda'
@@ -23,6 +23,7 @@ class DBInstance(AWSResource):
         enum_spec = ('describe_db_instances', 'DBInstances', None)
         tags_spec = ('list_tags_for_resource', 'TagList',
                      'ResourceName', 'arn')
+        inline_tags = 'TagList'
         detail_spec = None
         id = 'DBInstanceIdentifier'
         filter_name = 'DBInstanceIdentifier'
@@ -30,6 +30,7 @@ class Cluster(AWSResource):
         dimension = 'ClusterIdentifier'
         tags_spec = ('describe_tags', 'TaggedResources[]',
                      'ResourceName', 'arn')
+        inline_tags = 'Tags'
 
     @property
     def arn(self):
@@ -10,45 +10,139 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
-import jmespath
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from six.moves import queue
+
+from skew.cache import get_cache
 from skew.resources.aws import AWSResource
 
 LOG = logging.getLogger(__name__)
 
+# The number of threads used to look up the location of the buckets
+# that are not in the cache yet.
+LocationWorkers = 8
+
+# When listing objects in parallel, objects are handed over in batches of
+# BatchSize and at most MaxPendingBatches batches are buffered for each
+# prefix being listed.
+BatchSize = 1000
+MaxPendingBatches = 4
+
+# Markers used between the listing threads and the consumer
+_Started = object()
+_Done = object()
+
+
+def _put(q, item, stop):
+    """
+    Put ``item`` in ``q``, unless the consumer went away.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(q):
+    """
+    Yield the objects put in ``q`` by a listing thread until it is done.
+    """
+    while True:
+        item = q.get()
+        if item is _Done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        for obj in item:
+            yield obj
+
 
 class Bucket(AWSResource):
 
+    # Bucket names are global, so are their locations
     _location_cache = {}
 
     @classmethod
     def enumerate(cls, session_factory, arn, resource_id=None):
-        resources = super(Bucket, cls).enumerate(
-            session_factory, arn, resource_id)
-        region_resources = []
+        resources = list(super(Bucket, cls).enumerate(
+            session_factory, arn, resource_id))
         region = session_factory.region_name or 'us-east-1'
+        # The buckets are listed once per account (see global_listing) and
+        # so are their locations, each region keeps its own buckets.
+        locations = arn.shared_listing(
+            (session_factory.account, 's3', 'get_bucket_location',
+             resource_id),
+            lambda: cls._find_locations(resources))
+        for r in resources:
+            if locations.get(r.id, 'us-east-1') == region:
+                yield r
+
+    @classmethod
+    def _find_locations(cls, resources):
+        """
+        Return the locations of the ``resources``, from the in-memory
+        cache, then from the on-disk ``bucket_location`` cache (if
+        enabled) and finally by calling get_bucket_location for the
+        remaining buckets, concurrently.
+        """
+        disk_cache = get_cache('bucket_location')
+        locations = {}
+        missing = []
         for r in resources:
             location = cls._location_cache.get(r.id)
+            if location is None and disk_cache is not None:
+                location = disk_cache.get(r.id)
             if location is None:
-                LOG.debug('finding location for %s', r.id)
-                kwargs = {'Bucket': r.id}
-                response = r._client.call('get_bucket_location', **kwargs)
-                location = response.get('LocationConstraint', 'us-east-1')
-                if location is None:
-                    location = 'us-east-1'
-                if location is 'EU':
-                    location = 'eu-west-1'
-                cls._location_cache[r.id] = location
-            if location == region:
-                region_resources.append(r)
-        return region_resources
+                missing.append(r)
+            else:
+                locations[r.id] = location
+        if missing:
+            LOG.debug('finding location for %d buckets', len(missing))
+            workers = min(LocationWorkers, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                found = dict(
+                    (r.id, location) for r, location in
+                    zip(missing, executor.map(cls._get_location, missing))
+                    if location is not None)
+            if found and disk_cache is not None:
+                disk_cache.update(found)
+            locations.update(found)
+        cls._location_cache.update(locations)
+        return locations
+
+    @classmethod
+    def _get_location(cls, resource):
+        response = resource._client.call(
+            'get_bucket_location', Bucket=resource.id)
+        if not response:
+            # The call failed, don't cache anything
+            return None
+        location = response.get('LocationConstraint')
+        if not location:
+            location = 'us-east-1'
+        elif location == 'EU':
+            location = 'eu-west-1'
+        return location
+
+    @classmethod
+    def operations(cls, **scan_options):
+        # list_objects_v2 is only called when iterating over a bucket
+        return [('enum', 'list_buckets', 'account'),
+                ('detail', 'get_bucket_location', 'resource'),
+                ('tags', cls.Meta.tags_spec[0], 'resource')]
 
     class Meta(object):
         service = 's3'
         type = 'bucket'
         enum_spec = ('list_buckets', 'Buckets[]', None)
-        detail_spec = ('list_objects', 'Bucket', 'Contents[]')
+        global_listing = True
+        detail_spec = ('list_objects_v2', 'Bucket', 'Contents[]')
         id = 'Name'
         filter_name = None
         name = 'BucketName'
@@ -60,13 +154,128 @@ class Bucket(AWSResource):
     def __init__(self, session_factory, client, data, query=None):
         super(Bucket, self).__init__(session_factory, client, data, query)
         self._data = data
-        self._keys = []
 
     def __iter__(self):
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: self.id}
-        if not self._keys:
-            data = self._client.call(detail_op, **params)
-            self._keys = jmespath.search(detail_path, data)
-        for key in self._keys:
-            yield key
+        return self.objects()
+
+    def objects(self, prefix='', max_workers=None, ordered=True,
+                delimiter='/'):
+        """
+        Generate the objects (the ``Contents`` entries of
+        ListObjectsV2) of this bucket whose key starts with ``prefix``.
+        Objects are yielded as the pages are listed and are not kept.
+
+        With ``max_workers``, the keys are split on ``delimiter`` into
+        the prefixes right below ``prefix`` and up to ``max_workers``
+        of those prefixes are listed concurrently.  Memory stays bounded:
+        at most ``MaxPendingBatches`` batches of ``BatchSize`` objects
+        are buffered per prefix.  If ``ordered`` is True the objects are
+        yielded in key order, as with a sequential listing, otherwise
+        they are yielded as soon as they are listed.
+        """
+        if not max_workers:
+            detail_op, param_name, detail_path = self.Meta.detail_spec
+            params = {param_name: self.id}
+            if prefix:
+                params['Prefix'] = prefix
+            return self._client.iter_pages(
+                detail_op, query=detail_path, **params)
+        return self._parallel_objects(prefix, max_workers, ordered,
+                                      delimiter)
+
+    def _list_prefix(self, prefix, out, stop):
+        try:
+            detail_op, param_name, detail_path = self.Meta.detail_spec
+            params = {param_name: self.id, 'Prefix': prefix}
+            batch = []
+            for obj in self._client.iter_pages(
+                    detail_op, query=detail_path, **params):
+                batch.append(obj)
+                if len(batch) >= BatchSize:
+                    if not _put(out, batch, stop):
+                        return
+                    batch = []
+            if batch and not _put(out, batch, stop):
+                return
+            _put(out, _Done, stop)
+        except Exception as e:
+            _put(out, e, stop)
+
+    def _list_top_level(self, prefix, delimiter, out, submit, stop):
+        """
+        List the objects right below ``prefix`` and hand each of the
+        prefixes below it to ``submit``.  With ``ordered`` listings,
+        ``submit`` returns the queue of the prefix, which is put in
+        ``out`` in key order with the batches of objects.
+        """
+        try:
+            detail_op, param_name, _ = self.Meta.detail_spec
+            params = {param_name: self.id, 'Delimiter': delimiter}
+            if prefix:
+                params['Prefix'] = prefix
+            for page in self._client.iter_pages(detail_op, **params):
+                entries = [(o['Key'], o) for o in page.get('Contents', [])]
+                entries.extend((p['Prefix'], None)
+                               for p in page.get('CommonPrefixes', []))
+                entries.sort(key=lambda entry: entry[0])
+                batch = []
+                for key, obj in entries:
+                    if obj is not None:
+                        batch.append(obj)
+                        continue
+                    if batch and not _put(out, batch, stop):
+                        return
+                    batch = []
+                    prefix_queue = submit(key)
+                    if prefix_queue is not None and \
+                            not _put(out, prefix_queue, stop):
+                        return
+                if batch and not _put(out, batch, stop):
+                    return
+            _put(out, _Done, stop)
+        except Exception as e:
+            _put(out, e, stop)
+
+    def _parallel_objects(self, prefix, max_workers, ordered, delimiter):
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        if ordered:
+            # The consumer reads the batches and the prefix queues in key
+            # order, up to 2 * max_workers of them can be queued ahead.
+            out = queue.Queue(maxsize=2 * max_workers)
+
+            def submit(key):
+                prefix_queue = queue.Queue(maxsize=MaxPendingBatches)
+                executor.submit(self._list_prefix, key, prefix_queue, stop)
+                return prefix_queue
+        else:
+            # Everybody shares a single queue
+            out = queue.Queue(maxsize=MaxPendingBatches * max_workers)
+
+            def submit(key):
+                if _put(out, _Started, stop):
+                    executor.submit(self._list_prefix, key, out, stop)
+        lister = threading.Thread(
+            target=self._list_top_level,
+            args=(prefix, delimiter, out, submit, stop))
+        lister.daemon = True
+        lister.start()
+        try:
+            running = 1
+            while running:
+                item = out.get()
+                if item is _Started:
+                    running += 1
+                elif item is _Done:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                elif isinstance(item, list):
+                    for obj in item:
+                        yield obj
+                else:
+                    for obj in _drain(item):
+                        yield obj
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
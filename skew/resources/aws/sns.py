@@ -11,8 +11,6 @@
 
 import logging
 
-import jmespath
-
 from skew.resources.aws import AWSResource
 
 LOG = logging.getLogger(__name__)
@@ -31,6 +29,7 @@ class Topic(AWSResource):
         name = 'DisplayName'
         date = None
         dimension = 'TopicName'
+        lazy_detail = True
 
     @classmethod
     def filter(cls, arn, resource_id, data):
@@ -40,18 +39,14 @@ class Topic(AWSResource):
 
     @property
     def arn(self):
-        return self.data.get('TopicArn')
+        return self._arn
 
     def __init__(self, session_factory, client, data, query=None):
         super(Topic, self).__init__(session_factory, client, data, query)
 
         self._id = data['TopicArn'].split(':', 5)[5]
-
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: data['TopicArn']}
-        data = client.call(detail_op, **params)
-
-        self.data = jmespath.search(detail_path, data)
+        self._arn = data['TopicArn']
+        self._defer_detail(data['TopicArn'], data)
 
 
 class Subscription(AWSResource):
@@ -70,20 +65,24 @@ class Subscription(AWSResource):
         name = 'SubscriptionArn'
         date = None
         dimension = None
+        lazy_detail = True
 
     @property
     def arn(self):
-        return self.data.get('SubscriptionArn')
+        return self._arn
 
     @classmethod
     def enumerate(cls, session_factory, arn, resource_id=None):
         resources = super(Subscription, cls).enumerate(
             session_factory, arn, resource_id)
 
-        return [r for r in resources if r.id not in cls.invalid_arns]
+        for r in resources:
+            if r.id not in cls.invalid_arns:
+                yield r
 
     def __init__(self, session_factory, client, data, query=None):
         super(Subscription, self).__init__(session_factory, client, data, query)
+        self._arn = data['SubscriptionArn']
 
         if data['SubscriptionArn'] in self.invalid_arns:
             self._id = 'PendingConfirmation'
@@ -91,9 +90,4 @@ class Subscription(AWSResource):
 
         self._id = data['SubscriptionArn'].split(':', 6)[6]
         self._name = ""
-
-        detail_op, param_name, detail_path = self.Meta.detail_spec
-        params = {param_name: data['SubscriptionArn']}
-        data = client.call(detail_op, **params)
-
-        self.data = jmespath.search(detail_path, data)
+        self._defer_detail(data['SubscriptionArn'], data)
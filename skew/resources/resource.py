@@ -16,6 +16,7 @@ import logging
 import jmespath
 
 import skew.awsclient
+import skew.retry
 
 from botocore.exceptions import ClientError
 
@@ -27,7 +28,14 @@ class Resource(object):
     flyweight = True
 
     @classmethod
-    def enumerate(cls, session_factory, arn, resource_id=None):
+    def enumerate(cls, session_factory, arn, resource_id=None,
+                  enum_spec=None):
+        """
+        Generate the resources of this class.  Resources are yielded
+        page by page as the enumeration operation returns them.  An
+        ``enum_spec`` can be passed in to override ``Meta.enum_spec``
+        for this call only.
+        """
         client = session_factory.get_client(cls.Meta.service)
         kwargs = {}
         do_client_side_filtering = False
@@ -45,21 +53,21 @@ class Resource(object):
                     kwargs[filter_name] = resource_id
             else:
                 do_client_side_filtering = True
-        enum_op, path, extra_args = cls.Meta.enum_spec
+        enum_op, path, extra_args = enum_spec or cls.Meta.enum_spec
         if extra_args:
             kwargs.update(extra_args)
         LOG.debug('enum_op=%s' % enum_op)
         try:
-            data = client.call(enum_op, query=path, **kwargs)
-        except ClientError as e:
-            data = {}
-            # if the error is because the resource was not found, be quiet
-            if 'NotFound' not in e.response['Error']['Code']:
-                raise
-        # LOG.debug(data)
-        resources = []
-        if data:
-            for d in data:
+            if getattr(cls.Meta, 'global_listing', False):
+                # The listing is the same in every region, only make it
+                # once per account for the whole scan.
+                key = (session_factory.account, cls.Meta.service, enum_op,
+                       repr(sorted(kwargs.items())))
+                items = arn.shared_listing(key, lambda: list(
+                    client.iter_pages(enum_op, query=path, **kwargs)))
+            else:
+                items = client.iter_pages(enum_op, query=path, **kwargs)
+            for d in items:
                 if do_client_side_filtering:
                     # If the API does not support filtering, the resource
                     # class should provide a filter method that will
@@ -68,10 +76,57 @@ class Resource(object):
                     if not cls.filter(arn, resource_id, d):
                         continue
                 if cls.flyweight:
-                    resources.append(cls(session_factory, client, d, arn.query))
+                    yield cls(session_factory, client, d, arn.query)
                 else:
-                    resources.append(d)
-        return resources
+                    yield d
+        except ClientError as e:
+            # if the error is because the resource was not found, be quiet
+            # otherwise skip this shard rather than stopping the whole scan
+            if 'NotFound' not in e.response['Error']['Code']:
+                LOG.error('unable to enumerate %s.%s in %s for %s: %s',
+                          cls.Meta.service, cls.Meta.type,
+                          client.region_name, client.account_id, e)
+        except skew.retry.ConnectionErrors as e:
+            # e.g. an unreachable region, skip this shard as well
+            LOG.error('unable to enumerate %s.%s in %s for %s: %s',
+                      cls.Meta.service, cls.Meta.type,
+                      client.region_name, client.account_id, e)
+
+    @classmethod
+    def operations(cls, **scan_options):
+        """
+        The API operations made when this class is enumerated with
+        ``scan_options``, as a list of (kind, operation name, per)
+        tuples.  ``kind`` is ``enum`` for the enumeration itself,
+        ``detail`` for the follow-up calls made for every resource while
+        enumerating, ``lazy`` for the ones only made on demand (e.g. when
+        the data of a resource is first read, see the ``detail`` scan
+        option) and ``tags`` for the calls made when the tags of a
+        resource are read.  ``per`` tells whether
+        the operation is called once per ``shard`` (i.e. per account,
+        region and resource type), once per ``account`` (for the global
+        listings) or once per ``resource``.
+        """
+        operations = []
+        enum_spec = getattr(cls.Meta, 'enum_spec', None)
+        if enum_spec:
+            if getattr(cls.Meta, 'global_listing', False):
+                operations.append(('enum', enum_spec[0], 'account'))
+            else:
+                operations.append(('enum', enum_spec[0], 'shard'))
+        detail_spec = getattr(cls.Meta, 'detail_spec', None)
+        if detail_spec:
+            detail = 'full'
+            if getattr(cls.Meta, 'lazy_detail', False):
+                detail = scan_options.get('detail') or 'lazy'
+            if detail == 'full':
+                operations.append(('detail', detail_spec[0], 'resource'))
+            elif detail == 'lazy':
+                operations.append(('lazy', detail_spec[0], 'resource'))
+        tags_spec = getattr(cls.Meta, 'tags_spec', None)
+        if tags_spec:
+            operations.append(('tags', tags_spec[0], 'resource'))
+        return operations
 
     class Meta(object):
         type = 'resource'
@@ -0,0 +1,210 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Retry policy for the requests made by ``AWSClient``.
+
+Errors are classified by their error code: throttling and transient
+errors are retried with exponential backoff and full jitter, a few
+"expected" errors are ignored and everything else is an error.
+Connection errors and timeouts are retried like transient errors.  The
+policy can be tuned in the ``retry`` section of the skew config::
+
+    retry:
+      max_attempts: 8
+      base_delay: 0.5
+      max_delay: 20
+      budget: 500
+      operations:
+        get_bucket_location:
+          max_attempts: 3
+
+``max_attempts``, ``base_delay`` and ``max_delay`` can be overridden per
+operation.  ``budget`` is the size of the retry budget of each client:
+every retry costs ``RetryCost`` tokens and every successful request gives
+one back, so a client facing persistent errors stops retrying instead of
+making things worse.
+
+The clients are created with botocore's own retries turned off (see
+``skew.sessions.create_client``) so that every failed request is seen,
+and retried, by this policy only.
+"""
+
+import logging
+import random
+import threading
+
+import botocore.exceptions
+
+from skew.config import get_config
+
+LOG = logging.getLogger(__name__)
+
+RETRY = 'retry'
+IGNORE = 'ignore'
+FAIL = 'fail'
+
+ThrottlingErrorCodes = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'RequestThrottled',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'EC2ThrottledException',
+])
+
+TransientErrorCodes = frozenset([
+    'RequestTimeout',
+    'RequestTimeoutException',
+    'InternalError',
+    'InternalFailure',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+])
+
+# These errors are expected while scanning (e.g. no permission to read
+# a resource, or a bucket without any tags) and produce an empty result.
+IgnoredErrorCodes = frozenset([
+    'AccessDenied',
+    'AccessDeniedException',
+    'NoSuchTagSet',
+    'UnsupportedOperation',
+    'ResourceNotFoundFault',
+])
+
+# The errors raised by botocore when a request can't be sent or its
+# response can't be read (unreachable endpoint, timeouts, dropped
+# connections).
+ConnectionErrors = (botocore.exceptions.ConnectionError,
+                    botocore.exceptions.HTTPClientError)
+
+DefaultMaxAttempts = 8
+DefaultBaseDelay = 0.5
+DefaultMaxDelay = 20
+DefaultBudget = 500
+RetryCost = 5
+
+
+def error_code(error):
+    return error.response.get('Error', {}).get('Code', '')
+
+
+def is_throttling_error(error):
+    return error_code(error) in ThrottlingErrorCodes
+
+
+class RetryBudget(object):
+    """
+    A thread-safe token bucket limiting the number of retries.
+    """
+
+    def __init__(self, capacity=DefaultBudget):
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def withdraw(self, amount=RetryCost):
+        with self._lock:
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def deposit(self, amount=1):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RetryPolicy(object):
+
+    def __init__(self, max_attempts=DefaultMaxAttempts,
+                 base_delay=DefaultBaseDelay, max_delay=DefaultMaxDelay,
+                 budget=DefaultBudget, operations=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.operations = operations or {}
+
+    @classmethod
+    def from_config(cls, config):
+        config = config or {}
+        return cls(
+            max_attempts=config.get('max_attempts', DefaultMaxAttempts),
+            base_delay=config.get('base_delay', DefaultBaseDelay),
+            max_delay=config.get('max_delay', DefaultMaxDelay),
+            budget=config.get('budget', DefaultBudget),
+            operations=config.get('operations'))
+
+    def _get(self, op_name, name):
+        return self.operations.get(op_name, {}).get(
+            name, getattr(self, name))
+
+    def classify(self, error):
+        """
+        Return RETRY, IGNORE or FAIL for a botocore ``ClientError`` or
+        one of the ``ConnectionErrors``.
+        """
+        if isinstance(error, ConnectionErrors):
+            return RETRY
+        code = error_code(error)
+        if code in ThrottlingErrorCodes or code in TransientErrorCodes:
+            return RETRY
+        if code in IgnoredErrorCodes:
+            return IGNORE
+        return FAIL
+
+    def delay(self, op_name, attempt):
+        """
+        The number of seconds to wait before retrying ``op_name`` after
+        ``attempt`` failed attempts (exponential backoff, full jitter).
+        """
+        ceiling = min(self._get(op_name, 'max_delay'),
+                      self._get(op_name, 'base_delay') * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def should_retry(self, op_name, attempt, budget=None):
+        """
+        True if ``op_name`` can be retried after ``attempt`` failed
+        attempts, in which case the cost of the retry is taken from
+        ``budget``.
+        """
+        if attempt >= self._get(op_name, 'max_attempts'):
+            LOG.debug('%s failed %d times, giving up', op_name, attempt)
+            return False
+        if budget is not None and not budget.withdraw():
+            LOG.debug('retry budget exhausted, not retrying %s', op_name)
+            return False
+        return True
+
+
+_policy = None
+
+
+def get_retry_policy():
+    """
+    Return the retry policy defined by the skew config.
+    """
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy.from_config(get_config().get('retry'))
+    return _policy
@@ -0,0 +1,181 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+"""
+Process-wide botocore/boto3 sessions.
+
+Creating a session re-reads the AWS config and credentials files and each
+new botocore session comes with its own data loader, which parses the
+service models and ``endpoints.json`` again.  To avoid paying for that
+over and over, skew keeps one boto3 session per profile (or set of
+explicit credentials) and all of the sessions share a single data loader
+and endpoint resolver.
+
+boto3 and botocore are only imported when the first session is needed,
+so that importing skew stays cheap.
+
+Sessions, like locks, can't be shared with a forked child process
+(e.g. with ``executor='process'``), so everything is forgotten in the
+child and it builds its own.
+"""
+
+import logging
+import os
+import threading
+
+LOG = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_loader = None
+_endpoint_resolver = None
+_sessions = {}
+_pid = os.getpid()
+
+
+def _reset_after_fork():
+    global _lock, _loader, _endpoint_resolver, _sessions, _pid
+    # The inherited lock may be held by a thread that doesn't exist in
+    # this process, replace it rather than acquiring it.
+    _lock = threading.RLock()
+    _loader = None
+    _endpoint_resolver = None
+    _sessions = {}
+    _pid = os.getpid()
+
+
+def _check_fork():
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_loader():
+    """
+    Return the botocore data loader shared by all of skew's sessions.
+    """
+    global _loader
+    _check_fork()
+    with _lock:
+        if _loader is None:
+            import botocore.session
+            from botocore.loaders import create_loader
+            data_path = botocore.session.Session().get_config_variable(
+                'data_path')
+            _loader = create_loader(data_path)
+        return _loader
+
+
+def get_endpoint_resolver():
+    """
+    Return the endpoint resolver shared by all of skew's sessions.
+    """
+    global _endpoint_resolver
+    _check_fork()
+    with _lock:
+        if _endpoint_resolver is None:
+            from botocore.regions import EndpointResolver
+            loader = get_loader()
+            if hasattr(loader, 'load_data_with_path'):
+                endpoints, path = loader.load_data_with_path('endpoints')
+                _endpoint_resolver = EndpointResolver(
+                    endpoints, uses_builtin_data=loader.is_builtin_path(path))
+            else:
+                _endpoint_resolver = EndpointResolver(
+                    loader.load_data('endpoints'))
+        return _endpoint_resolver
+
+
+def get_botocore_session():
+    """
+    Return a new botocore session that uses the shared data loader and
+    endpoint resolver.
+    """
+    import botocore.session
+    session = botocore.session.Session()
+    session.register_component('data_loader', get_loader())
+    if hasattr(session, '_register_internal_component'):
+        session._register_internal_component(
+            'endpoint_resolver', get_endpoint_resolver())
+    else:
+        session.register_component(
+            'endpoint_resolver', get_endpoint_resolver())
+    return session
+
+
+def get_session(profile_name=None, aws_creds=None, placebo=None,
+                placebo_dir=None, placebo_mode='record'):
+    """
+    Return the shared boto3 session for a profile or, if ``aws_creds`` is
+    given, for that set of credentials.  The session is created on first
+    use and has no region of its own: pass ``region_name`` when creating
+    clients from it (see ``create_client``).
+
+    If ``placebo`` and ``placebo_dir`` are given, the session is attached
+    to placebo in ``placebo_mode`` when it is created.
+    """
+    if aws_creds:
+        credentials = tuple(sorted(aws_creds.items()))
+    else:
+        credentials = None
+    if not (placebo and placebo_dir):
+        placebo_dir = placebo_mode = None
+    key = (profile_name, credentials, placebo_dir, placebo_mode)
+    _check_fork()
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            LOG.debug('creating session for profile %s', profile_name)
+            import boto3
+            botocore_session = get_botocore_session()
+            if aws_creds:
+                session = boto3.Session(
+                    botocore_session=botocore_session, **aws_creds)
+            else:
+                session = boto3.Session(
+                    botocore_session=botocore_session,
+                    profile_name=profile_name)
+            if placebo_dir:
+                pill = placebo.attach(session, placebo_dir)
+                if placebo_mode == 'record':
+                    pill.record()
+                elif placebo_mode == 'playback':
+                    pill.playback()
+            _sessions[key] = session
+        return session
+
+
+def create_client(session, service_name, region_name=None):
+    """
+    Create a client from a shared session.  boto3 sessions are not
+    thread-safe so clients are created one at a time; the clients
+    themselves can be used from any thread.
+
+    botocore's own retries are turned off: failed requests are retried
+    by ``AWSClient`` according to skew's retry policy (see
+    ``skew.retry``), which must be the only one to retry them.
+    """
+    from botocore.config import Config
+    _check_fork()
+    with _lock:
+        return session.client(
+            service_name, region_name=region_name,
+            config=Config(retries={'max_attempts': 0}))
+
+
+def clear():
+    """
+    Forget all of the shared sessions.
+    """
+    _check_fork()
+    with _lock:
+        _sessions.clear()
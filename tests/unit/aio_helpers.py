@@ -0,0 +1,18 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+# Async generators are a syntax error before Python 3.6, this module is
+# only imported by test_aio on Python 3.6+.
+
+
+def collect(loop, async_scan):
+    async def _collect():
+        return [resource async for resource in async_scan]
+    return loop.run_until_complete(_collect())
@@ -0,0 +1,84 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+import placebo
+
+from skew import scan_async
+from skew.cache import FileCache
+
+if sys.version_info >= (3, 6):
+    import asyncio
+    from tests.unit.aio_helpers import collect
+
+
+@unittest.skipIf(sys.version_info < (3, 6), 'scan_async needs Python 3.6+')
+class TestAsyncScan(unittest.TestCase):
+
+    def _get_response_path(self, test_case):
+        p = os.path.join(os.path.dirname(__file__), 'responses')
+        return os.path.join(p, test_case)
+
+    def setUp(self):
+        self.environ = {}
+        self.environ_patch = mock.patch('os.environ', self.environ)
+        self.environ_patch.start()
+        credential_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                       'aws_credentials')
+        self.environ['AWS_CONFIG_FILE'] = credential_path
+        config_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                   'skew.yml')
+        self.environ['SKEW_CONFIG'] = config_path
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _collect(self, async_scan):
+        return collect(self.loop, async_scan)
+
+    def test_ec2(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        async_scan = scan_async(
+            'arn:aws:ec2:us-west-2:123456789012:instance/*',
+            max_concurrency=2, **placebo_cfg)
+        l = self._collect(async_scan)
+        self.assertEqual(len(l), 2)
+
+    def test_sizes(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        sizes = FileCache(os.path.join(cache_dir, 'sizes.json'))
+        with mock.patch('skew.cache.get_cache', return_value=sizes), \
+                mock.patch.object(sizes, 'update',
+                                  wraps=sizes.update) as update:
+            async_scan = scan_async(
+                'arn:aws:ec2:us-west-2:123456789012:instance/*',
+                **placebo_cfg)
+            self.assertEqual(len(self._collect(async_scan)), 2)
+        update.assert_called_once_with(
+            {'123456789012:us-west-2:aws.ec2.instance': 2})
+
+    def test_empty(self):
+        async_scan = scan_async('arn:aws:ec2:us-west-2:123456789012:foo/*')
+        self.assertEqual(self._collect(async_scan), [])
@@ -13,11 +13,49 @@
 # language governing permissions and limitations under the License.
 import unittest
 import os
+import shutil
+import tempfile
 
 import mock
 import placebo
 
 from skew import scan
+from skew.awsclient import AWSClient
+from skew.cache import FileCache
+from skew.resources.aws.s3 import Bucket
+
+
+class FakeS3Client(object):
+    """
+    Lists a fixed set of keys, two entries per page.
+    """
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+
+    def iter_pages(self, op_name, query=None, Bucket=None, Prefix='',
+                   Delimiter=None):
+        entries = []
+        for key in self.keys:
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common_prefix = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if common_prefix not in entries:
+                    entries.append(common_prefix)
+            else:
+                entries.append({'Key': key})
+        for i in range(0, len(entries), 2):
+            page = {'Contents': [e for e in entries[i:i + 2]
+                                 if isinstance(e, dict)],
+                    'CommonPrefixes': [{'Prefix': e} for e in entries[i:i + 2]
+                                       if not isinstance(e, dict)]}
+            if query is None:
+                yield page
+            else:
+                for obj in page['Contents']:
+                    yield obj
 
 
 class TestARN(unittest.TestCase):
@@ -67,6 +105,142 @@ class TestARN(unittest.TestCase):
         r = l[0]
         self.assertEqual(r.filtered_data, 't2.small')
 
+    def test_ec2_parallel(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*',
+                   max_workers=4, **placebo_cfg)
+        l = list(arn)
+        self.assertEqual(len(l), 2)
+
+    def test_ec2_process(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*',
+                   executor='process', max_workers=2, **placebo_cfg)
+        l = list(arn)
+        self.assertEqual(len(l), 2)
+        self.assertEqual(l[0].data['InstanceId'], 'i-db530902')
+
+    def test_shards(self):
+        arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*')
+        self.assertEqual(
+            arn.shards(),
+            [('arn', 'aws', 'ec2', 'us-west-2', '123456789012', 'instance')])
+        arn = scan('arn:aws:ec2:us-west-2:*:instance/*')
+        self.assertEqual(len(arn.shards()), 4)
+
+    def test_explain(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        sizes = FileCache(os.path.join(cache_dir, 'sizes.json'))
+        with mock.patch('skew.cache.get_cache', return_value=sizes):
+            arn = scan('arn:aws:ec2:us-west-2:*:instance/*')
+            plan = arn.explain()
+            self.assertEqual(plan['shards'], 4)
+            self.assertEqual(plan['unknown_shards'], 4)
+            self.assertEqual(plan['estimated_calls'], 4)
+            # Scanning an account records the size of its shard
+            arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*',
+                       **placebo_cfg)
+            self.assertEqual(len(list(arn)), 2)
+            plan = scan('arn:aws:ec2:us-west-2:*:instance/*').explain()
+        self.assertEqual(plan['unknown_shards'], 3)
+        self.assertEqual(plan['estimated_resources'], 2)
+        instances = plan['resource_types']['aws.ec2.instance']
+        self.assertEqual(instances['shards'], 4)
+        self.assertEqual(
+            [(o['kind'], o['operation'], o['estimated_calls'])
+             for o in instances['operations']],
+            [('enum', 'describe_instances', 4)])
+
+    def test_sizes_written_once(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        sizes = FileCache(os.path.join(cache_dir, 'sizes.json'))
+        with mock.patch('skew.cache.get_cache', return_value=sizes), \
+                mock.patch.object(sizes, 'update',
+                                  wraps=sizes.update) as update:
+            arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*',
+                       **placebo_cfg)
+            self.assertEqual(len(list(arn)), 2)
+        update.assert_called_once_with(
+            {'123456789012:us-west-2:aws.ec2.instance': 2})
+
+    def test_no_sizes_without_cache(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('instances_1'),
+            'placebo_mode': 'playback'}
+        with mock.patch('skew.cache.get_config', return_value={}), \
+                mock.patch('tempfile.mkstemp') as mkstemp:
+            arn = scan('arn:aws:ec2:us-west-2:123456789012:instance/*',
+                       **placebo_cfg)
+            self.assertEqual(len(list(arn)), 2)
+            self.assertEqual(arn._sizes, {})
+        self.assertFalse(mkstemp.called)
+
+    def test_explain_detail(self):
+        arn_string = 'arn:aws:dynamodb:us-west-2:123456789012:table/*'
+        operations = [
+            [(o['kind'], o['operation']) for o in plan['resource_types'][
+                'aws.dynamodb.table']['operations']]
+            for plan in (scan(arn_string).explain(),
+                         scan(arn_string, detail='full').explain(),
+                         scan(arn_string, detail='summary').explain())]
+        self.assertEqual(operations[0][:2], [('enum', 'list_tables'),
+                                             ('lazy', 'describe_table')])
+        self.assertEqual(operations[1][:2], [('enum', 'list_tables'),
+                                             ('detail', 'describe_table')])
+        self.assertEqual(operations[2][:1], [('enum', 'list_tables')])
+        self.assertNotIn('describe_table', [o for _, o in operations[2]])
+        arn_string = 'arn:aws:cloudformation:us-west-2:123456789012:stack/*'
+        self.assertEqual(
+            [[(o['kind'], o['operation']) for o in plan['resource_types'][
+                'aws.cloudformation.stack']['operations']]
+             for plan in (scan(arn_string).explain(),
+                          scan(arn_string, stack_resources=True).explain())],
+            [[('enum', 'describe_stacks'), ('lazy', 'list_stack_resources')],
+             [('enum', 'describe_stacks'),
+              ('detail', 'list_stack_resources')]])
+
+    def test_pruned_shards(self):
+        config = {'accounts': {
+            '111111111111': {'profile': 'a', 'regions': ['us-east-1']},
+            '222222222222': {'profile': 'b', 'partition': 'aws-cn'},
+            '333333333333': {'profile': 'c', 'regions': ['us-west-2']}}}
+        with mock.patch('skew.arn.get_config', return_value=config), \
+                mock.patch('skew.resources._expand_partition') as expand:
+            arn = scan('arn:*:ec2:*:*:instance/*')
+            shards = arn.shards()
+            self.assertEqual(
+                sorted(s[1:5] for s in shards if s[1] == 'aws'),
+                [('aws', 'ec2', 'us-east-1', '111111111111'),
+                 ('aws', 'ec2', 'us-west-2', '333333333333')])
+            self.assertTrue(all(s[4] == '222222222222'
+                                for s in shards if s[1] != 'aws'))
+            # Only the partitions with accounts are looked at
+            self.assertEqual(
+                set(c[0][0] for c in expand.call_args_list),
+                set(['aws', 'aws-cn']))
+            # Global services are not restricted by the allowlists
+            arn = scan('arn:aws:iam:*:*:user/*')
+            self.assertEqual(
+                [s[3:5] for s in arn.shards()],
+                [('', '111111111111'), ('', '333333333333')])
+
     def test_ec2_instance_not_found(self):
         placebo_cfg = {
             'placebo': placebo,
@@ -180,6 +354,98 @@ class TestARN(unittest.TestCase):
         l = list(arn)
         self.assertEqual(len(l), 5)
 
+    def test_s3_buckets_listed_once(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('buckets'),
+            'placebo_mode': 'playback'}
+        operations = []
+        iter_pages = AWSClient._iter_pages
+
+        def spy(client, op_name, *args, **kwargs):
+            operations.append(op_name)
+            return iter_pages(client, op_name, *args, **kwargs)
+
+        with mock.patch.object(AWSClient, '_iter_pages', spy):
+            arn = scan('arn:aws:s3:us-.*:234567890123:bucket/*',
+                       **placebo_cfg)
+            self.assertTrue(len(arn.shards()) > 1)
+            l = list(arn)
+        self.assertEqual(len(l), 5)
+        self.assertEqual(operations.count('list_buckets'), 1)
+        self.assertEqual(arn._listings, {})
+        plan = arn.explain()
+        buckets = plan['resource_types']['aws.s3.bucket']
+        self.assertEqual(buckets['operations'][0]['estimated_calls'], 1)
+        # Iterating again lists the buckets again
+        with mock.patch.object(AWSClient, '_iter_pages', spy):
+            self.assertEqual(len(list(arn)), 5)
+        self.assertEqual(operations.count('list_buckets'), 2)
+
+    def test_process_shards_global_listing(self):
+        arn = scan('arn:aws:*:*:*:*')
+        shards = [('arn', 'aws', service, region, '234567890123', type)
+                  for service, type in (('s3', 'bucket'), ('ec2', 'volume'))
+                  for region in ('us-east-1', 'us-west-2', 'eu-west-1')]
+        with mock.patch.object(arn, 'shards', return_value=shards):
+            groups = arn._account_region_shards()
+        buckets = [g for g in groups if g[0][5] == 'bucket']
+        volumes = [g for g in groups if g[0][5] == 'volume']
+        # All of the bucket shards of the account go to the same worker
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(len(buckets[0]), 3)
+        self.assertEqual(len(volumes), 3)
+
+    def test_s3_bucket_locations(self):
+        responses = {'eu': {'LocationConstraint': 'EU'},
+                     'us': {'ResponseMetadata': {}},
+                     'oregon': {'LocationConstraint': 'us-west-2'},
+                     'failed': {}}
+        buckets = []
+        for name in sorted(responses):
+            bucket = mock.Mock(id=name)
+            bucket._client.call.return_value = responses[name]
+            buckets.append(bucket)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        locations = FileCache(os.path.join(cache_dir, 'locations.json'))
+        with mock.patch.dict(Bucket._location_cache, clear=True), \
+                mock.patch('skew.resources.aws.s3.get_cache',
+                           return_value=locations):
+            expected = {'eu': 'eu-west-1', 'us': 'us-east-1',
+                        'oregon': 'us-west-2'}
+            self.assertEqual(Bucket._find_locations(buckets), expected)
+            self.assertEqual(Bucket._location_cache, expected)
+            # Another process would only have the on-disk cache
+            Bucket._location_cache.clear()
+            for bucket in buckets:
+                bucket._client.call.reset_mock()
+            self.assertEqual(Bucket._find_locations(buckets), expected)
+            self.assertEqual(
+                [b.id for b in buckets if b._client.call.called],
+                ['failed'])
+
+    def test_s3_bucket_objects(self):
+        keys = ['a.txt', 'a/1', 'a/2', 'a/b/3', 'b', 'c/1', 'c/2', 'c/3',
+                'd/x', 'e']
+        client = FakeS3Client(keys)
+        bucket = Bucket(None, client, {'Name': 'foobar'})
+        self.assertEqual([o['Key'] for o in bucket], keys)
+        self.assertEqual([o['Key'] for o in bucket.objects(prefix='c/')],
+                         ['c/1', 'c/2', 'c/3'])
+        with mock.patch('skew.resources.aws.s3.BatchSize', 2):
+            objects = bucket.objects(max_workers=2)
+            self.assertEqual([o['Key'] for o in objects], keys)
+            objects = bucket.objects(max_workers=2, ordered=False)
+            self.assertEqual(sorted(o['Key'] for o in objects), keys)
+            objects = bucket.objects(prefix='a/', max_workers=2)
+            self.assertEqual([o['Key'] for o in objects],
+                             ['a/1', 'a/2', 'a/b/3'])
+            # Stopping early doesn't leave the listing threads hanging
+            objects = bucket.objects(max_workers=1)
+            self.assertEqual(next(objects)['Key'], 'a.txt')
+            objects.close()
+
     def test_iam_groups(self):
         placebo_cfg = {
             'placebo': placebo,
@@ -203,8 +469,32 @@ class TestARN(unittest.TestCase):
         l = list(arn)
         self.assertEqual(len(l), 1)
         stack_resource = l[0]
+        self.assertNotIn('Resources', stack_resource.data)
         resources = list(stack_resource)
         self.assertEqual(len(resources), 4)
+        arn = scan('arn:aws:cloudformation:us-west-2:123456789012:stack/*',
+                   stack_resources=True, **placebo_cfg)
+        l = list(arn)
+        self.assertEqual(l[0].data['Resources'][0],
+                         {'id': 'foobar-tables',
+                          'type': 'AWS::DynamoDB::Table'})
+        self.assertEqual(len(l[0].data['Resources']), 4)
+
+    def test_lambda_functions(self):
+        placebo_cfg = {
+            'placebo': placebo,
+            'placebo_dir': self._get_response_path('functions'),
+            'placebo_mode': 'playback'}
+        arn = scan('arn:aws:lambda:us-west-2:123456789012:function/*',
+                   **placebo_cfg)
+        functions = dict((f.id, f.data['EventSources']) for f in arn)
+        # process-orders is only triggered through its "live" alias
+        self.assertEqual(functions, {
+            'resize-images': ['arn:aws:sqs:us-west-2:123456789012:uploads',
+                              'arn:aws:sqs:us-west-2:123456789012:thumbnails'],
+            'process-orders': [
+                'arn:aws:kinesis:us-west-2:123456789012:stream/orders'],
+            'nightly-report': []})
 
     def test_nat_gateways(self):
         placebo_cfg = {
@@ -0,0 +1,101 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import unittest
+import os
+
+import mock
+
+from skew.awsclient import AWSClient, ClientPool
+
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = {}
+        self.environ_patch = mock.patch('os.environ', self.environ)
+        self.environ_patch.start()
+        config_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                   'skew.yml')
+        self.environ['SKEW_CONFIG'] = config_path
+        self.client_patch = mock.patch('skew.awsclient.AWSClient')
+        self.client_cls = self.client_patch.start()
+        self.client_cls.side_effect = lambda *args, **kwargs: mock.Mock()
+
+    def tearDown(self):
+        self.client_patch.stop()
+
+    def test_reuse(self):
+        pool = ClientPool()
+        client = pool.get_client('ec2', 'us-west-2', '123456789012')
+        self.assertIs(
+            pool.get_client('ec2', 'us-west-2', '123456789012'), client)
+        self.assertIsNot(
+            pool.get_client('ec2', 'us-east-1', '123456789012'), client)
+        self.assertIsNot(
+            pool.get_client('ec2', 'us-west-2', '234567890123'), client)
+        self.assertEqual(self.client_cls.call_count, 3)
+
+    def test_eviction(self):
+        pool = ClientPool(maxsize=2)
+        ec2 = pool.get_client('ec2', 'us-west-2', '123456789012')
+        pool.get_client('s3', 'us-west-2', '123456789012')
+        # touch ec2 so that s3 becomes the least recently used client
+        pool.get_client('ec2', 'us-west-2', '123456789012')
+        pool.get_client('iam', '', '123456789012')
+        self.assertEqual(len(pool), 2)
+        self.assertIs(
+            pool.get_client('ec2', 'us-west-2', '123456789012'), ec2)
+        self.assertEqual(self.client_cls.call_count, 3)
+        pool.get_client('s3', 'us-west-2', '123456789012')
+        self.assertEqual(self.client_cls.call_count, 4)
+
+    def test_fork(self):
+        pool = ClientPool()
+        client = pool.get_client('ec2', 'us-west-2', '123456789012')
+        # A thread of the parent held the lock when the process forked
+        pool._lock.acquire()
+        with mock.patch('os.getpid', return_value=pool._pid + 1):
+            self.assertIsNot(
+                pool.get_client('ec2', 'us-west-2', '123456789012'), client)
+        self.assertEqual(len(pool), 1)
+
+
+class TestAWSClient(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = {}
+        self.environ_patch = mock.patch('os.environ', self.environ)
+        self.environ_patch.start()
+        credential_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                       'aws_credentials')
+        self.environ['AWS_CONFIG_FILE'] = credential_path
+        config_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                   'skew.yml')
+        self.environ['SKEW_CONFIG'] = config_path
+        self.create_patch = mock.patch('skew.sessions.create_client')
+        self.create_client = self.create_patch.start()
+        AWSClient._cached_identity.pop('345678901234', None)
+        AWSClient._cached_alias.pop('345678901234', None)
+
+    def tearDown(self):
+        self.create_patch.stop()
+
+    def test_lazy_identity(self):
+        sts = self.create_client.return_value
+        sts.get_caller_identity.return_value = {'Account': '345678901234'}
+        sts.list_account_aliases.return_value = {'AccountAliases': ['fie']}
+        client = AWSClient('ec2', 'us-west-2', '345678901234')
+        self.assertEqual(self.create_client.call_count, 1)
+        self.assertFalse(sts.get_caller_identity.called)
+        self.assertEqual(client.account_name, '345678901234 (fie)')
+        self.assertEqual(client.identity['Account'], '345678901234')
+        self.assertEqual(sts.get_caller_identity.call_count, 1)
+        self.assertEqual(sts.list_account_aliases.call_count, 1)
@@ -0,0 +1,48 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from skew.cache import FileCache
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache', 'test.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        cache = FileCache(self.path, ttl=60)
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual(cache.get('foo', 'bar'), 'bar')
+        cache.set('foo', {'fie': 'baz'})
+        self.assertEqual(cache.get('foo'), {'fie': 'baz'})
+        # another process sees the same entries
+        self.assertEqual(FileCache(self.path).get('foo'), {'fie': 'baz'})
+
+    def test_ttl(self):
+        cache = FileCache(self.path, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache.update({'foo': 1, 'bar': 2})
+        with mock.patch('time.time', return_value=1059):
+            self.assertEqual(cache.get('foo'), 1)
+        with mock.patch('time.time', return_value=1061):
+            self.assertEqual(cache.get('foo'), None)
+            cache.set('fie', 3)
+        self.assertEqual(FileCache(self.path)._read().keys(), set(['fie']))
@@ -0,0 +1,69 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import random
+import threading
+import time
+import unittest
+
+from skew.enrichment import enrich
+
+
+class FakeResource(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.detail = None
+
+    def __repr__(self):
+        return 'fake/%d' % self.id
+
+
+class TestEnrich(unittest.TestCase):
+
+    def test_order_and_failures(self):
+        threads = set()
+
+        def add_detail(resource):
+            threads.add(threading.current_thread().name)
+            time.sleep(random.uniform(0, 0.005))
+            if resource.id % 10 == 3:
+                raise ValueError('no detail for %d' % resource.id)
+            resource.detail = resource.id * 2
+
+        resources = list(enrich(
+            (FakeResource(i) for i in range(100)), add_detail, 4))
+        self.assertEqual([r.id for r in resources], list(range(100)))
+        self.assertEqual(resources[2].detail, 4)
+        self.assertIsNone(resources[13].detail)
+        self.assertEqual(str(resources[13].enrichment_errors[0]),
+                         'no detail for 13')
+        self.assertFalse(hasattr(resources[12], 'enrichment_errors'))
+        self.assertTrue(1 < len(threads) <= 4)
+
+    def test_serial(self):
+        threads = set()
+
+        def add_detail(resource):
+            threads.add(threading.current_thread().name)
+            resource.detail = resource.id
+
+        resources = list(enrich(
+            [FakeResource(i) for i in range(5)], add_detail, 1))
+        self.assertEqual([r.detail for r in resources], list(range(5)))
+        self.assertEqual(threads, set([threading.current_thread().name]))
+
+    def test_stop_early(self):
+        calls = []
+        resources = enrich((FakeResource(i) for i in range(1000)),
+                           calls.append, 2)
+        self.assertEqual(next(resources).id, 0)
+        resources.close()
+        self.assertTrue(len(calls) < 1000)
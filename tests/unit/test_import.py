@@ -0,0 +1,40 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import os
+import subprocess
+import sys
+import unittest
+
+Statement = """
+import sys
+import skew
+arn = skew.scan('arn:aws:ec2:us-west-2:123456789012:instance/*|InstanceId')
+print(repr(arn))
+print(' '.join(m for m in sys.modules if m.split('.')[0] in
+               ('boto3', 'botocore', 'skew.awsclient')))
+"""
+
+
+class TestImport(unittest.TestCase):
+
+    def test_no_boto_on_import(self):
+        here = os.path.dirname(__file__)
+        env = dict(os.environ)
+        env['SKEW_CONFIG'] = os.path.join(here, 'cfg', 'skew.yml')
+        # The child process imports skew from the same place we do
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.abspath(os.path.join(here, '..', '..'))] + sys.path)
+        output = subprocess.check_output(
+            [sys.executable, '-c', Statement], env=env)
+        lines = output.decode().splitlines()
+        self.assertEqual(
+            lines[0], 'arn:aws:ec2:us-west-2:123456789012:instance/*')
+        self.assertEqual(lines[1:], [''])
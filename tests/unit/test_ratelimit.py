@@ -0,0 +1,140 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import threading
+import unittest
+
+import boto3
+import mock
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import skew.ratelimit
+import skew.sessions
+from skew.ratelimit import RateLimiter
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': ''}}, 'Foo')
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_aimd(self):
+        limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=8)
+        self.assertRaises(ClientError, limiter.call,
+                          mock.Mock(side_effect=client_error('Throttling')))
+        self.assertEqual(limiter.concurrency, 4)
+        self.assertRaises(ClientError, limiter.call,
+                          mock.Mock(side_effect=client_error('Foo')))
+        self.assertEqual(limiter.concurrency, 4.25)
+        for _ in range(50):
+            limiter.call(lambda: None)
+        self.assertEqual(limiter.concurrency, 8)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(throttled=True)
+        self.assertEqual(limiter.concurrency, 1)
+
+    def test_concurrency(self):
+        limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=2)
+        limiter.acquire()
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def request():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release()
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(rate=2, burst=3, max_concurrency=10)
+        with mock.patch('time.sleep') as sleep:
+            with mock.patch('time.time', return_value=limiter._last):
+                for _ in range(3):
+                    limiter.call(lambda: None)
+                self.assertEqual(sleep.call_count, 0)
+                # The bucket is empty and the clock is stopped, so the
+                # next request has to wait for a token.
+                sleep.side_effect = StopIteration
+                self.assertRaises(StopIteration, limiter.acquire)
+                sleep.assert_called_with(0.5)
+
+    def test_client_throttled(self):
+        session = boto3.Session(
+            aws_access_key_id='foo', aws_secret_access_key='bar')
+        client = skew.sessions.create_client(session, 'ec2', 'us-west-2')
+        sends = []
+
+        def throttle(request, **kwargs):
+            sends.append(request)
+            body = (b'<Response><Errors><Error><Code>Throttling</Code>'
+                    b'<Message>Rate exceeded</Message></Error></Errors>'
+                    b'<RequestID>1</RequestID></Response>')
+            raw = mock.Mock(stream=mock.Mock(return_value=iter([body])))
+            return AWSResponse(request.url, 400, {}, raw)
+
+        client.meta.events.register('before-send', throttle)
+        limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=8)
+        with mock.patch('time.sleep') as sleep:
+            self.assertRaises(ClientError, limiter.call,
+                              client.describe_volumes)
+        # The first throttled request halves the concurrency, botocore
+        # didn't retry (and sleep) while holding a slot.
+        self.assertEqual(len(sends), 1)
+        self.assertEqual(sleep.call_count, 0)
+        self.assertEqual(limiter.concurrency, 4)
+
+
+class TestSettings(unittest.TestCase):
+
+    def tearDown(self):
+        skew.ratelimit.clear()
+
+    def test_settings(self):
+        config = {'rate_limits': {'rate': 50,
+                                  'services': {'iam': {'rate': 1}}}}
+        with mock.patch('skew.ratelimit.get_config', return_value=config):
+            self.assertEqual(skew.ratelimit.get_settings('ec2'),
+                             {'rate': 50, 'burst': 20,
+                              'max_concurrency': 10})
+            self.assertEqual(skew.ratelimit.get_settings('iam'),
+                             {'rate': 1, 'burst': 10, 'max_concurrency': 4})
+            # The global settings win over the built-in service defaults
+            self.assertEqual(skew.ratelimit.get_settings('sts'),
+                             {'rate': 50, 'burst': 10, 'max_concurrency': 4})
+            limiter = skew.ratelimit.get_rate_limiter(
+                '123456789012', '', 'iam')
+            self.assertIs(
+                skew.ratelimit.get_rate_limiter('123456789012', None, 'iam'),
+                limiter)
+            self.assertIsNot(
+                skew.ratelimit.get_rate_limiter('234567890123', None, 'iam'),
+                limiter)
+
+    @mock.patch('skew.ratelimit.get_config', return_value={})
+    def test_fork(self, get_config):
+        limiter = skew.ratelimit.get_rate_limiter(
+            '123456789012', 'us-west-2', 'ec2')
+        # A thread of the parent held the lock when the process forked
+        lock = skew.ratelimit._lock
+        lock.acquire()
+        self.addCleanup(lock.release)
+        with mock.patch('os.getpid',
+                        return_value=skew.ratelimit._pid + 1):
+            self.assertIsNot(skew.ratelimit.get_rate_limiter(
+                '123456789012', 'us-west-2', 'ec2'), limiter)
+        skew.ratelimit._reset_after_fork()
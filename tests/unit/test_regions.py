@@ -0,0 +1,59 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import unittest
+
+import mock
+
+import skew.regions
+
+
+class TestRegions(unittest.TestCase):
+
+    def setUp(self):
+        skew.regions.clear()
+
+    def test_regions(self):
+        self.assertIn('aws', skew.regions.get_partitions())
+        self.assertIn('aws-cn', skew.regions.get_partitions())
+        self.assertIn('us-west-2', skew.regions.get_regions('ec2', 'aws'))
+        self.assertIn('cn-north-1', skew.regions.get_regions('ec2', 'aws-cn'))
+        self.assertEqual(skew.regions.get_global_region('aws'), 'us-east-1')
+        self.assertEqual(skew.regions.get_global_region('aws-cn'),
+                         'cn-north-1')
+
+    def test_memoized(self):
+        regions = skew.regions.get_regions('ec2', 'aws')
+        session = skew.regions._get_session()
+        with mock.patch.object(session, 'get_available_regions') as gar:
+            self.assertEqual(skew.regions.get_regions('ec2', 'aws'), regions)
+            self.assertEqual(gar.call_count, 0)
+
+    def test_warm_up(self):
+        elapsed = skew.regions.warm_up(services=['ec2', 'iam'])
+        self.assertTrue(elapsed >= 0)
+        self.assertIn(('aws', 'ec2'), skew.regions._regions)
+        self.assertIn('aws-us-gov', skew.regions._global_regions)
+
+    def test_fork(self):
+        import skew.sessions
+        regions = skew.regions.get_regions('ec2', 'aws')
+        session = skew.regions._get_session()
+        loader = skew.sessions.get_loader()
+        lock = skew.sessions._lock
+        pid = skew.regions._pid
+        with mock.patch('os.getpid', return_value=pid + 1):
+            # A child process keeps the metadata but not the session
+            self.assertIsNot(skew.regions._get_session(), session)
+            self.assertIsNot(skew.sessions.get_loader(), loader)
+            self.assertIsNot(skew.sessions._lock, lock)
+            self.assertEqual(skew.regions.get_regions('ec2', 'aws'), regions)
+        skew.regions._reset_after_fork()
+        skew.sessions._reset_after_fork()
@@ -15,6 +15,7 @@ import os
 
 import mock
 
+import skew.regions
 import skew.resources
 import skew.awsclient
 from skew.resources.resource import Resource
@@ -62,3 +63,243 @@ class TestResource(unittest.TestCase):
     def test_all_services(self):
         all_providers = skew.resources.all_services('aws')
         self.assertEqual(len(all_providers), 21)
+
+    def test_lazy_partitions(self):
+        resource_types = skew.resources.ResourceTypesTemplate.copy()
+        index = dict((p, s) for p, s in skew.resources._index.items()
+                     if p == 'aws')
+        with mock.patch.object(skew.resources, 'ResourceTypes',
+                               resource_types), \
+                mock.patch.object(skew.resources, '_index', index), \
+                mock.patch.object(skew.resources, '_classes', {}), \
+                mock.patch.object(skew.resources, '_expanded_partitions',
+                                  set(['aws'])), \
+                mock.patch('skew.regions.get_regions',
+                           wraps=skew.regions.get_regions) as get_regions:
+            self.assertIn('ec2', skew.resources.all_services('aws'))
+            self.assertIs(
+                skew.resources.find_resource_class('aws.ec2.instance'),
+                skew.resources.find_resource_class('aws.ec2.instance'))
+            self.assertEqual(get_regions.call_count, 0)
+            self.assertNotIn('aws-cn.ec2.instance', resource_types)
+            self.assertIn('instance',
+                          skew.resources.all_types('aws-cn', 'ec2'))
+            self.assertIn('aws-cn.ec2.instance', resource_types)
+            self.assertNotIn('aws-us-gov.ec2.instance', resource_types)
+            self.assertEqual(index['aws-cn']['ec2']['instance'],
+                             'aws.ec2.Instance')
+            self.assertIs(
+                skew.resources.find_resource_class('aws-cn.ec2.instance'),
+                skew.resources.find_resource_class('aws.ec2.instance'))
+            self.assertRaises(KeyError, skew.resources.find_resource_class,
+                              'aws.ec2.foo')
+
+    def test_prefetch_tags(self):
+        from skew.resources.aws.elb import LoadBalancer
+
+        def describe_tags(op_name, query=None, LoadBalancerNames=None):
+            return [{'LoadBalancerName': name,
+                     'Tags': [{'Key': 'Name', 'Value': name.upper()}]}
+                    for name in LoadBalancerNames if name != 'lb-3']
+
+        client = mock.Mock()
+        client.iter_pages.side_effect = describe_tags
+        resources = [LoadBalancer(None, client,
+                                  data={'LoadBalancerName': 'lb-%d' % i})
+                     for i in range(45)]
+        LoadBalancer.prefetch_tags(resources)
+        self.assertEqual(client.iter_pages.call_count, 3)
+        self.assertEqual(
+            [len(c[1]['LoadBalancerNames'])
+             for c in client.iter_pages.call_args_list], [20, 20, 5])
+        self.assertEqual(resources[0].tags, {'Name': 'LB-0'})
+        self.assertEqual(resources[44].tags, {'Name': 'LB-44'})
+        self.assertEqual(resources[3].tags, {})
+        self.assertFalse(client.call.called)
+        # Already fetched
+        LoadBalancer.prefetch_tags(resources)
+        self.assertEqual(client.iter_pages.call_count, 3)
+
+    def test_prefetch_tags_failure(self):
+        from botocore.exceptions import ClientError
+        from skew.resources.aws.elb import LoadBalancer
+
+        def describe_tags(op_name, query=None, LoadBalancerNames=None):
+            if 'lb-25' in LoadBalancerNames:
+                raise ClientError(
+                    {'Error': {'Code': 'LoadBalancerNotFound',
+                               'Message': ''}}, 'DescribeTags')
+            return [{'LoadBalancerName': name,
+                     'Tags': [{'Key': 'Name', 'Value': name.upper()}]}
+                    for name in LoadBalancerNames]
+
+        client = mock.Mock()
+        client.iter_pages.side_effect = describe_tags
+        client.call.return_value = [{'Key': 'Name', 'Value': 'ONE-BY-ONE'}]
+        resources = list(LoadBalancer._prefetching_tags(
+            LoadBalancer(None, client, data={'LoadBalancerName': 'lb-%d' % i})
+            for i in range(45)))
+        self.assertEqual(len(resources), 45)
+        self.assertEqual(client.iter_pages.call_count, 3)
+        self.assertEqual(resources[0].tags, {'Name': 'LB-0'})
+        self.assertEqual(resources[44].tags, {'Name': 'LB-44'})
+        self.assertFalse(client.call.called)
+        # The tags of the failed batch are fetched with the tags_spec
+        self.assertFalse(resources[20]._tags_fetched)
+        self.assertEqual(resources[20].tags, {'Name': 'ONE-BY-ONE'})
+        self.assertEqual(client.call.call_count, 1)
+
+    def test_inline_tags(self):
+        from skew.resources.aws.rds import DBInstance
+        from skew.resources.aws.redshift import Cluster
+        from skew.resources.aws.elasticache import Cluster as CacheCluster
+
+        client = mock.Mock()
+        db = DBInstance(None, client, data={
+            'DBInstanceIdentifier': 'db',
+            'TagList': [{'Key': 'env', 'Value': 'prod'}]})
+        self.assertEqual(db.tags, {'env': 'prod'})
+        self.assertTrue(db.tags_expected)
+        cluster = Cluster(None, client, data={
+            'ClusterIdentifier': 'a',
+            'Tags': [{'Key': 'team', 'Value': 'data'}]})
+        self.assertEqual(cluster.tags, {'team': 'data'})
+        self.assertFalse(client.call.called)
+        # Older APIs don't return the TagList
+        client = mock.Mock(service_name='rds', region_name='us-east-1',
+                           account_id='123456789012', partition_name='aws')
+        client.call.return_value = [{'Key': 'env', 'Value': 'test'}]
+        db = DBInstance(None, client, data={'DBInstanceIdentifier': 'db'})
+        self.assertEqual(db.tags, {'env': 'test'})
+        self.assertEqual(client.call.call_count, 1)
+        # Classes without inline_tags always call their tags_spec
+        client.call.return_value = [{'Key': 'env', 'Value': 'stale'}]
+        cache_cluster = CacheCluster(None, client, data={
+            'CacheClusterId': 'c', 'Tags': []})
+        self.assertEqual(cache_cluster.tags, {'env': 'stale'})
+        self.assertEqual(client.call.call_count, 2)
+
+    def test_lazy_detail(self):
+        from skew.resources.aws.dynamodb import Table
+
+        def iter_pages(op_name, query=None, **kwargs):
+            if op_name == 'list_tables':
+                return iter(['foo', 'bar'])
+            return iter([{'Table': {'TableName': kwargs['TableName'],
+                                    'ItemCount': 42}}])
+
+        client = mock.Mock()
+        client.iter_pages.side_effect = iter_pages
+        table = Table(None, client, 'foo')
+        self.assertEqual(table.id, 'foo')
+        self.assertFalse(client.iter_pages.called)
+        self.assertEqual(table.data['ItemCount'], 42)
+        self.assertEqual(table.name, 'foo')
+        client.iter_pages.assert_called_once_with('describe_table',
+                                                  TableName='foo')
+
+        session_factory = mock.Mock(kwargs={'detail': 'full'})
+        session_factory.get_client.return_value = client
+        tables = list(Table.enumerate(session_factory, mock.Mock()))
+        self.assertEqual(client.iter_pages.call_count, 4)
+        self.assertEqual([t.id for t in tables], ['foo', 'bar'])
+        self.assertEqual(tables[1].data['ItemCount'], 42)
+        self.assertEqual(client.iter_pages.call_count, 4)
+
+        session_factory = mock.Mock(kwargs={'detail': 'summary'})
+        table = Table(session_factory, client, 'foo')
+        self.assertEqual(table.data, {'TableName': 'foo'})
+        self.assertEqual(table.name, 'foo')
+        self.assertEqual(client.iter_pages.call_count, 4)
+
+        session_factory = mock.Mock(kwargs={'detail': 'some'})
+        self.assertRaises(ValueError, Table, session_factory, client, 'foo')
+
+    def test_lazy_detail_concurrent_and_missing(self):
+        import threading
+        import time
+        from skew.resources.aws.dynamodb import Table
+
+        def describe_table(op_name, TableName):
+            time.sleep(0.01)
+            return iter([{'Table': {'TableName': TableName,
+                                    'ItemCount': 42}}])
+
+        client = mock.Mock()
+        client.iter_pages.side_effect = describe_table
+        table = Table(None, client, 'foo')
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(table.data['ItemCount']))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(client.iter_pages.call_count, 1)
+
+        # Ignored errors (e.g. AccessDenied) produce no page
+        client = mock.Mock()
+        client.iter_pages.return_value = iter([])
+        table = Table(None, client, 'gone')
+        self.assertEqual(table.data, {'TableName': 'gone'})
+        self.assertEqual(table.name, 'gone')
+        self.assertEqual(client.iter_pages.call_count, 1)
+
+    def test_detail_errors(self):
+        from botocore.exceptions import ClientError
+        from skew.resources.aws.dynamodb import Table
+
+        def iter_pages(op_name, query=None, **kwargs):
+            if op_name == 'list_tables':
+                return iter(['foo', 'gone'])
+            if kwargs['TableName'] == 'gone':
+                raise ClientError(
+                    {'Error': {'Code': 'ResourceNotFoundException',
+                               'Message': ''}}, 'DescribeTable')
+            return iter([{'Table': {'TableName': 'foo', 'ItemCount': 42}}])
+
+        client = mock.Mock()
+        client.iter_pages.side_effect = iter_pages
+        # Read lazily, the error is logged and the summary kept
+        table = Table(None, client, 'gone')
+        self.assertEqual(table.data, {'TableName': 'gone'})
+        self.assertFalse(hasattr(table, 'enrichment_errors'))
+
+        # Fetched while enumerating, the error is reported
+        session_factory = mock.Mock(kwargs={'detail': 'full'})
+        session_factory.get_client.return_value = client
+        foo, gone = Table.enumerate(session_factory, mock.Mock())
+        self.assertEqual(foo.data['ItemCount'], 42)
+        self.assertFalse(hasattr(foo, 'enrichment_errors'))
+        self.assertEqual(gone.data, {'TableName': 'gone'})
+        self.assertEqual(
+            [type(e) for e in gone.enrichment_errors], [ClientError])
+
+    def test_lambda_event_sources(self):
+        function_cls = skew.resources.find_resource_class(
+            'aws.lambda.function')
+        arn = 'arn:aws:lambda:us-east-1:123456789012:function:%s'
+        pages = {
+            'list_functions': [
+                {'FunctionName': name, 'FunctionArn': arn % name}
+                for name in ('a', 'b', 'c')],
+            'list_event_source_mappings': [
+                {'FunctionArn': arn % 'a', 'EventSourceArn': 'queue-1'},
+                {'FunctionArn': arn % 'c', 'EventSourceArn': 'queue-2'},
+                {'FunctionArn': arn % 'a', 'EventSourceArn': 'stream-1'}],
+        }
+        client = mock.Mock()
+        client.iter_pages.side_effect = \
+            lambda op_name, query=None, **kwargs: iter(pages[op_name])
+        session_factory = mock.Mock(kwargs={})
+        session_factory.get_client.return_value = client
+        functions = list(function_cls.enumerate(session_factory, mock.Mock()))
+        self.assertEqual(
+            [f.data['EventSources'] for f in functions],
+            [['queue-1', 'stream-1'], [], ['queue-2']])
+        self.assertEqual(
+            [c[0][0] for c in client.iter_pages.call_args_list],
+            ['list_functions', 'list_event_source_mappings'])
+        self.assertFalse(client.call.called)
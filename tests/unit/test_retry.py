@@ -0,0 +1,211 @@
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+import os
+import unittest
+
+import boto3
+import mock
+from botocore.exceptions import (
+    ClientError, EndpointConnectionError, ReadTimeoutError)
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+import skew.retry
+import skew.sessions
+from skew.awsclient import AWSClient
+from skew.retry import RetryBudget, RetryPolicy
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': ''}}, 'Foo')
+
+
+class RawResponse(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_classify(self):
+        policy = RetryPolicy()
+        self.assertEqual(policy.classify(client_error('Throttling')),
+                         skew.retry.RETRY)
+        self.assertEqual(
+            policy.classify(client_error('RequestLimitExceeded')),
+            skew.retry.RETRY)
+        self.assertEqual(policy.classify(client_error('AccessDenied')),
+                         skew.retry.IGNORE)
+        self.assertEqual(
+            policy.classify(client_error('InvalidInstanceID.NotFound')),
+            skew.retry.FAIL)
+        self.assertEqual(
+            policy.classify(ReadTimeoutError(endpoint_url='https://foo')),
+            skew.retry.RETRY)
+
+    def test_delay(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5,
+                             operations={'foo': {'max_delay': 1}})
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= policy.delay('bar', attempt) <= 5)
+            self.assertTrue(0 <= policy.delay('foo', attempt) <= 1)
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3,
+                             operations={'foo': {'max_attempts': 1}})
+        self.assertTrue(policy.should_retry('bar', 2))
+        self.assertFalse(policy.should_retry('bar', 3))
+        self.assertFalse(policy.should_retry('foo', 1))
+        budget = RetryBudget(capacity=7)
+        self.assertTrue(policy.should_retry('bar', 1, budget))
+        self.assertFalse(policy.should_retry('bar', 1, budget))
+        budget.deposit(10)
+        self.assertEqual(budget.tokens, 7)
+
+
+class TestAWSClientRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = {}
+        self.environ_patch = mock.patch('os.environ', self.environ)
+        self.environ_patch.start()
+        credential_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                       'aws_credentials')
+        self.environ['AWS_CONFIG_FILE'] = credential_path
+        config_path = os.path.join(os.path.dirname(__file__), 'cfg',
+                                   'skew.yml')
+        self.environ['SKEW_CONFIG'] = config_path
+        session = boto3.Session(
+            aws_access_key_id='foo', aws_secret_access_key='bar')
+        self.ec2 = skew.sessions.create_client(session, 'ec2', 'us-west-2')
+        self.stubber = Stubber(self.ec2)
+        self.create_patch = mock.patch(
+            'skew.sessions.create_client', return_value=self.ec2)
+        self.create_patch.start()
+        self.sleep_patch = mock.patch('time.sleep')
+        self.sleep = self.sleep_patch.start()
+        self.delay_patch = mock.patch.object(
+            RetryPolicy, 'delay', return_value=42)
+        self.delay_patch.start()
+
+    def tearDown(self):
+        self.create_patch.stop()
+        self.sleep_patch.stop()
+        self.delay_patch.stop()
+
+    def retries(self):
+        return self.sleep.call_args_list.count(mock.call(42))
+
+    def test_resume_from_failing_page(self):
+        self.stubber.add_response(
+            'describe_volumes',
+            {'Volumes': [{'VolumeId': 'vol-1'}], 'NextToken': 'page2'})
+        self.stubber.add_client_error('describe_volumes', 'Throttling')
+        self.stubber.add_response(
+            'describe_volumes', {'Volumes': [{'VolumeId': 'vol-2'}]},
+            {'NextToken': 'page2'})
+        client = AWSClient('ec2', 'us-west-2', '123456789012')
+        with self.stubber:
+            data = client.call('describe_volumes', query='Volumes[].VolumeId')
+        self.assertEqual(data, ['vol-1', 'vol-2'])
+        self.assertEqual(self.retries(), 1)
+
+    def test_iter_pages_resume(self):
+        self.stubber.add_response(
+            'describe_volumes',
+            {'Volumes': [{'VolumeId': 'vol-1'}], 'NextToken': 'page2'})
+        self.stubber.add_response(
+            'describe_volumes',
+            {'Volumes': [{'VolumeId': 'vol-2'}], 'NextToken': 'page3'},
+            {'NextToken': 'page2'})
+        self.stubber.add_client_error('describe_volumes', 'Throttling')
+        self.stubber.add_response(
+            'describe_volumes', {'Volumes': [{'VolumeId': 'vol-3'}]},
+            {'NextToken': 'page3'})
+        client = AWSClient('ec2', 'us-west-2', '123456789012')
+        with self.stubber:
+            volumes = list(client.iter_pages(
+                'describe_volumes', query='Volumes[].VolumeId'))
+            self.stubber.assert_no_pending_responses()
+        self.assertEqual(volumes, ['vol-1', 'vol-2', 'vol-3'])
+        self.assertEqual(self.retries(), 1)
+
+    def test_enumerate_skips_failing_shard(self):
+        from skew.resources.aws.ec2 import Volume
+        self.stubber.add_client_error('describe_volumes', 'OptInRequired')
+        session_factory = mock.Mock()
+        session_factory.get_client.return_value = AWSClient(
+            'ec2', 'us-west-2', '123456789012')
+        with self.stubber:
+            volumes = list(Volume.enumerate(session_factory, mock.Mock()))
+        self.assertEqual(volumes, [])
+
+    def test_retry_timeout(self):
+        client = AWSClient('ec2', 'us-west-2', '123456789012')
+        with mock.patch.object(self.ec2, '_make_api_call', side_effect=[
+                ReadTimeoutError(endpoint_url='https://foo'),
+                {'Volumes': [{'VolumeId': 'vol-1'}]}]):
+            volumes = list(client.iter_pages(
+                'describe_volumes', query='Volumes[].VolumeId'))
+        self.assertEqual(volumes, ['vol-1'])
+        self.assertEqual(self.retries(), 1)
+
+    def test_enumerate_skips_unreachable_shard(self):
+        from skew.resources.aws.ec2 import Volume
+        session_factory = mock.Mock()
+        session_factory.get_client.return_value = AWSClient(
+            'ec2', 'us-west-2', '123456789012')
+        with mock.patch.object(
+                self.ec2, '_make_api_call',
+                side_effect=EndpointConnectionError(
+                    endpoint_url='https://foo')):
+            volumes = list(Volume.enumerate(session_factory, mock.Mock()))
+        self.assertEqual(volumes, [])
+        self.assertEqual(self.retries(), skew.retry.DefaultMaxAttempts - 1)
+
+    def test_no_botocore_retries(self):
+        sends = []
+        seen = []
+
+        def throttle(request, **kwargs):
+            sends.append(request)
+            body = (b'<Response><Errors><Error><Code>Throttling</Code>'
+                    b'<Message>Rate exceeded</Message></Error></Errors>'
+                    b'<RequestID>1</RequestID></Response>')
+            return AWSResponse(request.url, 400, {}, RawResponse(body))
+
+        def classify(policy, error):
+            seen.append((len(sends), skew.retry.error_code(error)))
+            return skew.retry.FAIL
+
+        self.ec2.meta.events.register('before-send', throttle)
+        client = AWSClient('ec2', 'us-west-2', '123456789012')
+        with mock.patch.object(RetryPolicy, 'classify', autospec=True,
+                               side_effect=classify):
+            self.assertRaises(
+                ClientError, list, client.iter_pages('describe_volumes'))
+        # botocore didn't retry the throttled request before skew saw it
+        self.assertEqual(seen, [(1, 'Throttling')])
+
+    def test_give_up(self):
+        for _ in range(2 * skew.retry.DefaultMaxAttempts):
+            self.stubber.add_client_error('describe_volumes', 'Throttling')
+        client = AWSClient('ec2', 'us-west-2', '123456789012')
+        with self.stubber:
+            self.assertEqual(client.call('describe_volumes'), {})
+            self.assertRaises(
+                ClientError, list, client.iter_pages('describe_volumes'))
+        self.assertEqual(self.retries(),
+                         2 * (skew.retry.DefaultMaxAttempts - 1))